@@ -45,7 +45,8 @@ setup_languages()
 
 ### sidebar
 sidebar()
-csv_upload()
+if st.session_state["language_ready"]:
+    csv_upload()
 
 
 # logout
@@ -68,7 +69,8 @@ with tabs[0]:
     show_round()
 
 with tabs[1]:
-    calc_stats()
+    if st.session_state["language_ready"]:
+        calc_stats()
 
 with tabs[2]:
     st.markdown(
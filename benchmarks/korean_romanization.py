@@ -0,0 +1,93 @@
+"""
+compare the table-driven korean romanization with the old character by character version
+
+    python benchmarks/korean_romanization.py [path/to/kor-eng.zip]
+
+without a path, random hangul sentences stand in for the manythings.org corpus
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper.ingest import (
+    KO_FINALS,
+    KO_INITIALS,
+    KO_MEDIALS,
+    ko_transliterate,
+    ko_transliterate_batch,
+    read_pairs,
+)
+
+
+def old_ko_transliterate(text):
+    "the previous implementation, decomposing each syllable and concatenating strings"
+    # it rebuilt its tables on every call
+    INITIALS, MEDIALS, FINALS = list(KO_INITIALS), list(KO_MEDIALS), list(KO_FINALS)
+
+    def decompose_hangul(char):
+        code = ord(char)
+        if not (0xAC00 <= code <= 0xD7A3):
+            return char  # Not a Hangul syllable
+
+        syllable_index = code - 0xAC00
+        cho = syllable_index // 588
+        jung = (syllable_index % 588) // 28
+        jong = syllable_index % 28
+
+        return INITIALS[cho] + MEDIALS[jung] + FINALS[jong]
+
+    result = ""
+    for char in text:
+        result += decompose_hangul(char)
+    return result
+
+
+def random_sentences(n, seed=1):
+    "hangul sentences with some punctuation, latin and digits mixed in"
+    rng = random.Random(seed)
+    other = list(" ?!.,0123456789abc")
+    sentences = []
+    for _ in range(n):
+        words = [
+            "".join(
+                (
+                    chr(0xAC00 + rng.randrange(11172))
+                    if rng.random() < 0.95
+                    else rng.choice(other)
+                )
+                for _ in range(rng.randint(1, 5))
+            )
+            for _ in range(rng.randint(2, 10))
+        ]
+        sentences.append(" ".join(words) + rng.choice([".", "?", "!"]))
+    return sentences
+
+
+def timed(function, sentences):
+    start = time.perf_counter()
+    result = function(sentences)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sentences = [
+            x for chunk in read_pairs(sys.argv[1], "kor") for x in chunk.translation
+        ]
+    else:
+        sentences = random_sentences(200000)
+    print(f"{len(sentences)} sentences")
+
+    old, old_seconds = timed(lambda x: [old_ko_transliterate(y) for y in x], sentences)
+    new, new_seconds = timed(ko_transliterate_batch, sentences)
+
+    assert (
+        old == new == [ko_transliterate(x) for x in sentences]
+    ), "romanization changed"
+    print(f"old: {old_seconds:.2f}s")
+    print(f"table: {new_seconds:.2f}s ({old_seconds / new_seconds:.1f}x faster)")
+    print("output identical")
@@ -0,0 +1,49 @@
+"""
+upload translation throughput at different concurrency settings, against the stub backend
+
+    OPEN_CLOZE_TRANSLATION_STUB_SECONDS=0.05 python benchmarks/translation.py [n_sentences]
+
+the cache is pointed at a temporary directory, so the real one is left alone
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper import translation
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    sentences = [f"sentence {i}." for i in range(n)]
+    print(f"{n} sentences, {translation.STUB_SECONDS}s per round trip")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        translation.TRANSLATION_DIR = temp_dir
+        for workers in [1, 4, 16]:
+            translation._caches.clear()
+            source_lang = f"w{workers}"  # a cache of its own per run
+            result, seconds = timed(
+                lambda: translation.translate_sentences(
+                    sentences, source_lang, backend="stub", workers=workers
+                )
+            )
+            assert result == [f"[{source_lang}] {x}" for x in sentences]
+            print(f"{workers} workers: {seconds:.2f}s ({n / seconds:.0f} sentences/s)")
+
+        # the same text again, answered from the cache
+        _, seconds = timed(
+            lambda: translation.translate_sentences(
+                sentences, "w16", backend="stub", workers=16
+            )
+        )
+        print(f"uploaded again: {seconds:.3f}s")
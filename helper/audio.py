@@ -0,0 +1,88 @@
+import hashlib
+import os
+import threading
+import uuid
+
+# recordings shared by every user, named by what was synthesized
+AUDIO_DIR = "database/_audio"
+# upper bound on the disk used by cached recordings
+AUDIO_CACHE_BYTES = int(os.environ.get("OPEN_CLOZE_AUDIO_CACHE_MB", 1024)) * 1024**2
+
+_size = None  # bytes in the cache directory, counted on first write
+_lock = threading.Lock()
+
+
+def audio_key(language, engine, text):
+    "content address of a recording"
+    return hashlib.sha256(f"{language}|{engine}|{text}".encode("utf-8")).hexdigest()
+
+
+def audio_path(language, engine, text, extension="mp3"):
+    "where a recording is cached, spread over subdirectories to keep them small"
+    key = audio_key(language, engine, text)
+    return f"{AUDIO_DIR}/{key[:2]}/{key}.{extension}"
+
+
+def _cached_files():
+    "(path, last used, bytes) of every cached recording"
+    files = []
+    for root, _, names in os.walk(AUDIO_DIR):
+        for name in names:
+            if name.startswith("tmp."):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((path, stat.st_mtime, stat.st_size))
+    return files
+
+
+def _evict():
+    "remove least recently used recordings until the cache is under its cap"
+    global _size
+    files = sorted(_cached_files(), key=lambda x: x[1])
+    _size = sum(x[2] for x in files)
+    # leave some room so the next few writes don't each trigger a scan
+    while _size > AUDIO_CACHE_BYTES * 0.9 and len(files) > 1:
+        path, _, n_bytes = files.pop(0)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        _size -= n_bytes
+
+
+def cached_audio(language, engine, text, synthesize, extension="mp3"):
+    "path of a recording of text, calling synthesize(path) only if it isn't cached yet. None if synthesis fails"
+    path = audio_path(language, engine, text, extension)
+    if os.path.exists(path):
+        # the modification time doubles as last use for eviction
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+
+    # write to a temporary name, so readers never see a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{os.path.dirname(path)}/tmp.{uuid.uuid4().hex}.{extension}"
+    try:
+        synthesize(tmp_path)
+        os.replace(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    global _size
+    with _lock:
+        if _size is None:
+            _evict()
+        else:
+            _size += os.path.getsize(path)
+            if _size > AUDIO_CACHE_BYTES:
+                _evict()
+
+    return path
@@ -0,0 +1,312 @@
+"""
+build language databases without the app, e.g. on a build box before deploying
+
+    python -m helper.build [language or abbreviation ...] [--mirror DIR] [--zip PATH ...]
+
+run from the repository root. Every language in metadata.csv is built if none are named.
+Archives are taken from --zip and --mirror (named <abbr>-eng.zip as on manythings.org),
+and downloaded otherwise unless --offline. Finished stages are checkpointed, so running the
+same command again after a failure picks up where it stopped. Every finished database in
+the folder is then packaged into the template zip new users start from, unless a language
+failed.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from helper.ingest import (
+    INGEST_WORKERS,
+    backfill_transliterations,
+    file_hash,
+    ingest_archive,
+)
+from helper.languages import download_stanza, fetch_archive
+from helper.storage import BACKENDS, SHARED_USER, STORAGE_BACKEND, user_dir
+
+# stages of a build, in order, each checkpointed once done
+BUILD_STAGES = ["download", "ingest", "transliterate"]
+# where archives that weren't given are downloaded to
+DOWNLOAD_DIR = "build/downloads"
+# folder the app expects inside the template zip
+TEMPLATE_DIR = "db_template"
+# fixed timestamp of every file in the template zip, so equal databases give equal zips
+TEMPLATE_DATE = (1980, 1, 1, 0, 0, 0)
+# sidecars only meaningful on the machine that built the database, left out of the template
+CHECKPOINT_META = ["build", "ingest"]
+
+
+def full_storage(user_id, lang_abr):
+    "a complete database of the configured backend, never an overlay of the shared corpus"
+    return BACKENDS[STORAGE_BACKEND](user_id, lang_abr)
+
+
+def language_abbrs(metadata_path="metadata.csv"):
+    "{language: manythings abbreviation} of every language in the metadata"
+    metadata = pd.read_csv(metadata_path)
+    languages = metadata.loc[lambda x: x.field == "language", :]
+    return dict(zip(languages.value, languages.manythings_abbr))
+
+
+def select_languages(names, abbrs):
+    "[(language, abbreviation)] of the languages asked for by name or abbreviation, all of them if none"
+    if len(names) == 0:
+        return list(abbrs.items())
+    by_abbr = {abbr: language for language, abbr in abbrs.items()}
+    selected = []
+    for name in names:
+        if name in abbrs:
+            selected.append((name, abbrs[name]))
+        elif name in by_abbr:
+            selected.append((by_abbr[name], name))
+        else:
+            raise ValueError(f"{name} is not a language in metadata.csv")
+    return selected
+
+
+def archive_sources(zips=(), mirror=None):
+    "{abbreviation: path} of the local archives, named <abbr>-eng.zip"
+    sources = {}
+    if mirror is not None:
+        for file in sorted(os.listdir(mirror)):
+            if file.endswith("-eng.zip"):
+                sources[file[: -len("-eng.zip")]] = os.path.join(mirror, file)
+    # archives given one by one take precedence over the mirror
+    for path in zips:
+        file = os.path.basename(path)
+        if not file.endswith("-eng.zip"):
+            raise ValueError(f"{path} isn't named <abbr>-eng.zip")
+        sources[file[: -len("-eng.zip")]] = path
+    return sources
+
+
+def build_language(
+    language,
+    lang_abr,
+    source=None,
+    user_id=SHARED_USER,
+    workers=INGEST_WORKERS,
+    download_dir=DOWNLOAD_DIR,
+    offline=False,
+    force=False,
+):
+    "run the stages of one language not checkpointed yet. Returns {stage: seconds}, None for stages skipped"
+    storage = full_storage(user_id, lang_abr)
+    os.makedirs(user_dir(user_id), exist_ok=True)
+    seconds = {}
+
+    start = time.time()
+    zip_path = fetch_archive(lang_abr, source, download_dir, offline)
+    source_hash = file_hash(zip_path)
+    seconds["download"] = time.time() - start
+
+    # checkpoints only hold for the archive they were made from
+    checkpoint = None if force else storage.load_meta("build")
+    if (
+        checkpoint is None
+        or checkpoint["source"] != source_hash
+        or not storage.exists()
+    ):
+        checkpoint = {"source": source_hash, "stages": {}}
+    checkpoint["stages"]["download"] = round(seconds["download"], 2)
+
+    if "ingest" in checkpoint["stages"]:
+        seconds["ingest"] = None
+    else:
+        start = time.time()
+        download_stanza(lang_abr)
+        # resumes from the last chunk written, transliterations are their own stage
+        ingest_archive(
+            storage,
+            zip_path,
+            language,
+            lang_abr,
+            workers=workers,
+            transliterate=False,
+            resume=not force,
+            source_hash=source_hash,
+        )
+        seconds["ingest"] = time.time() - start
+        checkpoint["stages"]["ingest"] = round(seconds["ingest"], 2)
+        storage.save_meta("build", checkpoint)
+
+    if "transliterate" in checkpoint["stages"]:
+        seconds["transliterate"] = None
+    else:
+        start = time.time()
+        if storage.load_meta("transliteration_backfill") is not None:
+            backfill_transliterations(storage, language, pause=0)
+        seconds["transliterate"] = time.time() - start
+        checkpoint["stages"]["transliterate"] = round(seconds["transliterate"], 2)
+        storage.save_meta("build", checkpoint)
+
+    return seconds
+
+
+def language_files(user_id, lang_abr):
+    "the database and the json files beside it of a language, without the build's checkpoints"
+    storage = full_storage(user_id, lang_abr)
+    files = [os.path.basename(storage.path)]
+    checkpoints = [os.path.basename(storage.meta_path(x)) for x in CHECKPOINT_META]
+    for file in sorted(os.listdir(user_dir(user_id))):
+        if (
+            file.startswith(f"{lang_abr}.")
+            and file.endswith(".json")
+            and file not in checkpoints
+        ):
+            files.append(file)
+    return files
+
+
+def finished_languages(user_id, lang_abrs):
+    "the languages whose database every build stage has been checkpointed for"
+    finished = []
+    for lang_abr in lang_abrs:
+        storage = full_storage(user_id, lang_abr)
+        checkpoint = storage.load_meta("build")
+        if (
+            storage.exists()
+            and checkpoint is not None
+            and all(x in checkpoint["stages"] for x in BUILD_STAGES)
+        ):
+            finished.append(lang_abr)
+    return finished
+
+
+def package_template(user_id, lang_abrs, output="db_template.zip"):
+    "zip the finished databases into the template the app copies for new users"
+    tmp_path = f"{output}.tmp"
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        for lang_abr in sorted(lang_abrs):
+            for file in language_files(user_id, lang_abr):
+                info = zipfile.ZipInfo(f"{TEMPLATE_DIR}/{file}", TEMPLATE_DATE)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(f"{user_dir(user_id)}/{file}", "rb") as src:
+                    with zip_ref.open(info, "w") as dst:
+                        shutil.copyfileobj(src, dst, 1024**2)
+    os.replace(tmp_path, output)
+
+
+def configure_logging():
+    "show the ingest reports and model loads the helpers log, in this process or a worker"
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+
+def format_seconds(seconds):
+    return "checkpointed" if seconds is None else f"{seconds:.1f}s"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m helper.build",
+        description="build language databases from manythings.org archives",
+    )
+    parser.add_argument(
+        "languages",
+        nargs="*",
+        help="names or abbreviations from metadata.csv, all of them if none",
+    )
+    parser.add_argument("--zip", action="append", default=[], help="a local archive")
+    parser.add_argument("--mirror", help="a directory of <abbr>-eng.zip archives")
+    parser.add_argument("--download-dir", default=DOWNLOAD_DIR)
+    parser.add_argument(
+        "--offline", action="store_true", help="fail languages without a local archive"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="languages built at the same time"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=INGEST_WORKERS,
+        help="processes segmenting each language",
+    )
+    parser.add_argument(
+        "--user", default=SHARED_USER, help="whose database folder to build into"
+    )
+    parser.add_argument("--output", default="db_template.zip")
+    parser.add_argument(
+        "--no-package", action="store_true", help="don't write the template zip"
+    )
+    parser.add_argument(
+        "--package-failed",
+        action="store_true",
+        help="write the template zip even if some languages failed",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="ignore checkpoints and build again"
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    try:
+        abbrs = language_abbrs()
+        languages = select_languages(args.languages, abbrs)
+        sources = archive_sources(args.zip, args.mirror)
+    except ValueError as error:
+        parser.error(str(error))
+    start = time.time()
+
+    built, failed = {}, {}
+    # spawned rather than forked, like the ingest workers each language may start
+    with ProcessPoolExecutor(
+        max_workers=max(1, args.jobs),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=configure_logging,
+    ) as executor:
+        futures = {
+            executor.submit(
+                build_language,
+                language,
+                lang_abr,
+                sources.get(lang_abr),
+                args.user,
+                args.workers,
+                args.download_dir,
+                args.offline,
+                args.force,
+            ): lang_abr
+            for language, lang_abr in languages
+        }
+        for future in as_completed(futures):
+            lang_abr = futures[future]
+            try:
+                built[lang_abr] = future.result()
+                stages = ", ".join(
+                    f"{x} {format_seconds(y)}" for x, y in built[lang_abr].items()
+                )
+                print(f"{lang_abr} done: {stages}")
+            except Exception as error:
+                failed[lang_abr] = error
+                print(f"{lang_abr} failed: {error}")
+
+    if len(failed) > 0 and not args.package_failed:
+        print(f"not packaging {args.output}, {len(failed)} languages failed")
+    elif len(built) > 0 and not args.no_package:
+        package_start = time.time()
+        # every finished language, not only those built this time
+        packaged = finished_languages(args.user, abbrs.values())
+        package_template(args.user, packaged, args.output)
+        print(
+            f"packaged {len(packaged)} languages into {args.output} in {time.time() - package_start:.1f}s"
+        )
+
+    print(
+        f"built {len(built)} of {len(languages)} languages in {time.time() - start:.1f}s"
+    )
+    for stage in BUILD_STAGES:
+        total = sum(x[stage] or 0 for x in built.values())
+        print(f"  {stage}: {total:.1f}s summed over languages")
+    return 1 if len(failed) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import os
+import threading
+from collections import OrderedDict
+
+# upper bound on the memory held by cached corpora, shared by every session
+CORPUS_CACHE_BYTES = int(os.environ.get("OPEN_CLOZE_CACHE_MB", 512)) * 1024**2
+
+_corpora = OrderedDict()  # (user_id, lang_abr, name, version) -> (value, n_bytes)
+_lock = threading.Lock()
+
+
+def _evict():
+    "drop least recently used corpora until under the memory cap, keeping the newest"
+    total = sum(x[1] for x in _corpora.values())
+    while total > CORPUS_CACHE_BYTES and len(_corpora) > 1:
+        _, (_, n_bytes) = _corpora.popitem(last=False)
+        total -= n_bytes
+
+
+def cached(storage, name, build):
+    "object derived from a language database, rebuilt when the database changes"
+    version = storage.version()
+    key = (storage.user_id, storage.lang_abr, name, version)
+
+    with _lock:
+        if key in _corpora:
+            _corpora.move_to_end(key)
+            return _corpora[key][0]
+
+    value = build()
+    if hasattr(value, "memory_usage"):
+        n_bytes = int(value.memory_usage(deep=True).sum())
+    else:
+        n_bytes = int(value.nbytes)
+
+    with _lock:
+        # anything cached from an older version of the file is stale now
+        for stale in [x for x in _corpora if x[:2] == key[:2] and x[3] != version]:
+            del _corpora[stale]
+        _corpora[key] = (value, n_bytes)
+        _evict()
+
+    return value
+
+
+def load_corpus(storage, set_name=None):
+    "parsed language database (or one of its sets) shared by all sessions, read-only"
+    return cached(
+        storage,
+        ("corpus", set_name),
+        lambda: storage.read(sets=None if set_name is None else [set_name]),
+    )
+
+
+def invalidate_corpus(storage):
+    "forget every cached version of a language database, call after writing to it"
+    with _lock:
+        for key in [
+            x for x in _corpora if x[:2] == (storage.user_id, storage.lang_abr)
+        ]:
+            del _corpora[key]
+
+
+def corpus_cache_info():
+    "number of cached corpora and the bytes they hold"
+    with _lock:
+        return len(_corpora), sum(x[1] for x in _corpora.values())
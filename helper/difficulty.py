@@ -0,0 +1,322 @@
+import numpy as np
+import os
+import pandas as pd
+import string
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from helper.cache import cached, invalidate_corpus, load_corpus
+from helper.manifest import refresh_manifest
+
+# sentences read back at a time when rescoring a database
+RESCORE_CHUNK_ROWS = int(os.environ.get("OPEN_CLOZE_INGEST_CHUNK_ROWS", 20000))
+
+
+class DifficultyIndex:
+    "a set's difficulties sorted once, for percentile lookups and difficulty range slices"
+
+    def __init__(self, difficulty):
+        difficulty = np.asarray(difficulty, dtype=float)
+        self.n = len(difficulty)
+        self.n_valid = int((~np.isnan(difficulty)).sum())
+        self.order = np.argsort(difficulty, kind="stable")[: self.n_valid]  # nan last
+        self.sorted = difficulty[self.order]
+
+    @property
+    def nbytes(self):
+        return self.order.nbytes + self.sorted.nbytes
+
+    def percentiles(self, difficulty):
+        "share of the set strictly easier than each difficulty"
+        difficulty = np.asarray(difficulty, dtype=float)
+        below = np.searchsorted(self.sorted, difficulty, side="left")
+        return np.where(np.isnan(difficulty), 0, below) / max(self.n, 1)
+
+    def quantile(self, q):
+        "same as pd.Series.quantile, interpolating linearly between ranks"
+        if self.n_valid == 0:
+            return np.nan
+        position = q * (self.n_valid - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, self.n_valid - 1)
+        return self.sorted[lower] + (self.sorted[upper] - self.sorted[lower]) * (
+            position - lower
+        )
+
+    def positions_between(self, lower_bound, upper_bound):
+        "row positions, in set order, of difficulties within the bounds"
+        start = np.searchsorted(self.sorted, lower_bound, side="left")
+        end = np.searchsorted(self.sorted, upper_bound, side="right")
+        return np.sort(self.order[start:end])
+
+
+def load_difficulty_index(storage, set_name):
+    "difficulty index of a set, shared by all sessions until the database changes"
+    return cached(
+        storage,
+        ("difficulty", set_name),
+        lambda: DifficultyIndex(load_corpus(storage, set_name).difficulty.values),
+    )
+
+
+# determining the difficulty of a sentence
+# the punctuation stripped before scoring
+STRIP_PUNCTUATION = str.maketrans("", "", string.punctuation + "。" + "、" + "？")
+
+
+def _strip(texts):
+    "lowercased texts without punctuation"
+    # lowercasing depends on the neighbouring letters (greek final sigma), so text by text
+    texts = [str(x).lower() for x in texts]
+    # removing punctuation doesn't, so all at once
+    stripped = "\x00".join(texts).translate(STRIP_PUNCTUATION).split("\x00")
+    # a text holding the separator, do them one by one instead
+    if len(stripped) != len(texts):
+        stripped = [x.translate(STRIP_PUNCTUATION) for x in texts]
+    return stripped
+
+
+def _word_matrix(texts):
+    "sparse count matrix of the whitespace separated words of each text, and the words. None if there are none"
+    # sklearn takes a while to import, so only once something is scored
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    vectorizer = CountVectorizer(analyzer=str.split)
+    try:
+        matrix = vectorizer.fit_transform(_strip(texts)).tocsr()
+    except ValueError:
+        return None, None
+    return matrix, vectorizer.get_feature_names_out()
+
+
+def _document_frequencies(matrix, words):
+    "number of texts each term appears in, terms as TfidfVectorizer sees them"
+    from scipy import sparse
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    # terms never span whitespace, so each word maps to a fixed set of terms
+    analyzer = CountVectorizer().build_analyzer()
+    terms = {}
+    word_ids, term_ids = [], []
+    for i, word in enumerate(words):
+        for term in set(analyzer(word)):
+            word_ids.append(i)
+            term_ids.append(terms.setdefault(term, len(terms)))
+    if len(terms) == 0:
+        return {}
+    mapping = sparse.csr_matrix(
+        (np.ones(len(word_ids)), (word_ids, term_ids)), shape=(len(words), len(terms))
+    )
+    present = ((matrix @ mapping) > 0).tocsr()
+    return dict(zip(terms, np.bincount(present.indices, minlength=len(terms)).tolist()))
+
+
+def count_documents(texts, counts):
+    "add the number of texts each term appears in to counts"
+    matrix, words = _word_matrix(texts)
+    if matrix is not None:
+        counts.update(_document_frequencies(matrix, words))
+    return counts
+
+
+def idf_weights(counts, n_documents, mean_percentile=0.1):
+    "smoothed idf of every term, as fitted by TfidfVectorizer, and the weight of unknown terms"
+    terms = list(counts)
+    df = np.array([counts[x] for x in terms], dtype=float)
+    idf = np.log((1 + n_documents) / (1 + df)) + 1
+    weights = dict(zip(terms, idf.tolist()))
+
+    # mean of first 10th percentile for missing values
+    lowest = np.sort(idf)[: int(len(idf) * mean_percentile)]
+    mean_value = lowest.mean() if len(lowest) > 0 else np.nan
+    return weights, mean_value
+
+
+def _score(matrix, words, weights, mean_value):
+    "difficulty of each row of a word matrix, unknown words weigh mean_value"
+    word_weights = np.array([weights.get(x, mean_value) for x in words], dtype=float)
+
+    # words without a weight are left out, as pandas skips missing values
+    known = ~np.isnan(word_weights)
+    sums = matrix @ np.where(known, word_weights, 0)
+    n_known = matrix @ known.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / n_known
+
+    # lower score = easier, higher = harder. mean of sentence sum and mean, to control for hard and long/short sentences
+    scores = np.where(n_known > 0, (means + sums) / 2, sums)
+    return np.round(scores, 2)
+
+
+def score_texts(texts, weights, mean_value):
+    "difficulty of each text given idf weights"
+    matrix, words = _word_matrix(texts)
+    if matrix is None:
+        return np.zeros(len(texts))
+    return _score(matrix, words, weights, mean_value)
+
+
+def gen_difficulty(corpus, mean_percentile=0.1):
+    "difficulty of every sentence of a corpus, scored against the corpus itself"
+    matrix, words = _word_matrix(corpus.translation)
+    if matrix is None:
+        return np.zeros(len(corpus))
+    weights, mean_value = idf_weights(
+        _document_frequencies(matrix, words), len(corpus), mean_percentile
+    )
+    return _score(matrix, words, weights, mean_value)
+
+
+# persisted idf model, document frequencies per set so sets can be added and removed
+_model_locks = (
+    {}
+)  # (user_id, lang_abr) -> lock held while its model is read, changed and saved
+_model_locks_lock = threading.Lock()
+
+
+def _model_lock(storage):
+    "lock serializing the updates to a database's idf model across sessions and the rescore thread"
+    key = (storage.user_id, storage.lang_abr)
+    with _model_locks_lock:
+        if key not in _model_locks:
+            # reentrant, updates load the model while holding it
+            _model_locks[key] = threading.RLock()
+        return _model_locks[key]
+
+
+def _add_counts(model, set_name, texts):
+    "add the document frequencies of texts to a set's entry of the model"
+    entry = model["sets"].setdefault(set_name, {"n_documents": 0, "df": {}})
+    counts = count_documents(texts, Counter(entry["df"]))
+    entry["df"] = dict(counts)
+    entry["n_documents"] += len(texts)
+    return model
+
+
+def build_idf_model(storage):
+    "count the document frequencies of every set in a database and save them"
+    model = {"sets": {}}
+    max_sentence_id = storage.max_sentence_id() or 0
+    for start in range(1, max_sentence_id + 1, RESCORE_CHUNK_ROWS):
+        chunk = storage.read(
+            sentence_ids=range(start, start + RESCORE_CHUNK_ROWS),
+            columns=["sentence_id", "set", "translation"],
+        )
+        for set_name, rows in chunk.dropna(subset=["translation"]).groupby("set"):
+            _add_counts(model, set_name, rows.translation)
+    storage.save_meta("idf", model)
+    return model
+
+
+def load_idf_model(storage):
+    "idf model of a language database, built on first use for older databases"
+    with _model_lock(storage):
+        model = storage.load_meta("idf")
+        if model is None:
+            model = build_idf_model(storage)
+        return model
+
+
+def save_idf_model(storage, set_name, counts, n_documents):
+    "replace the model with a single set, e.g. after ingesting a whole language"
+    model = {"sets": {set_name: {"n_documents": n_documents, "df": dict(counts)}}}
+    storage.save_meta("idf", model)
+    return model
+
+
+def add_to_idf_model(storage, set_name, texts):
+    "count new sentences of a set into the model"
+    with _model_lock(storage):
+        model = _add_counts(load_idf_model(storage), set_name, texts)
+        storage.save_meta("idf", model)
+        return model
+
+
+def drop_from_idf_model(storage, set_name):
+    "remove a deleted set from the model"
+    with _model_lock(storage):
+        model = load_idf_model(storage)
+        model["sets"].pop(set_name, None)
+        storage.save_meta("idf", model)
+        return model
+
+
+def model_weights(model):
+    "idf weights and unknown word weight of the whole language"
+    counts = Counter()
+    n_documents = 0
+    for entry in model["sets"].values():
+        counts.update(entry["df"])
+        n_documents += entry["n_documents"]
+    return idf_weights(counts, n_documents)
+
+
+def rescore(storage, sets=None):
+    "score existing sentences again against the current model, a chunk at a time"
+    # an overlay only rescores the user's own sets, not the whole shared corpus
+    sets = storage.own_sets() if sets is None else sets
+    if sets is not None and len(sets) == 0:
+        return
+    weights, mean_value = model_weights(load_idf_model(storage))
+    if storage.concurrent_writes:
+        max_sentence_id = storage.max_sentence_id() or 0
+        for start in range(1, max_sentence_id + 1, RESCORE_CHUNK_ROWS):
+            chunk = storage.read(
+                sets=sets,
+                sentence_ids=range(start, start + RESCORE_CHUNK_ROWS),
+                columns=["sentence_id", "translation"],
+            )
+            if len(chunk) > 0:
+                chunk["difficulty"] = score_texts(
+                    chunk.translation.fillna(""), weights, mean_value
+                )
+                storage.update_rows(chunk, columns=["difficulty"])
+    else:
+        # a csv is read and rewritten whole on every call, so it is read in one pass
+        # and its scores are saved in one go, as ingest_archive does
+        scores = []
+        for chunk in storage.iter_chunks(
+            ["sentence_id", "set", "translation"], RESCORE_CHUNK_ROWS
+        ):
+            if sets is not None:
+                chunk = chunk.loc[lambda x: x.set.isin(sets), :].copy()
+            chunk["difficulty"] = score_texts(
+                chunk.translation.fillna(""), weights, mean_value
+            )
+            scores.append(chunk.loc[:, ["sentence_id", "difficulty"]])
+        if len(scores) > 0:
+            storage.update_rows(pd.concat(scores), columns=["difficulty"])
+
+    invalidate_corpus(storage)
+    set_names = [x for x in storage.set_names() if isinstance(x, str)]
+    refresh_manifest(storage, set_names if sets is None else sets)
+
+
+_rescorer = None
+_queued = set()  # (user_id, lang_abr) waiting to be rescored
+_lock = threading.Lock()
+
+
+def _run_rescore(storage):
+    with _lock:
+        _queued.discard((storage.user_id, storage.lang_abr))
+    rescore(storage)
+
+
+def rescore_in_background(storage):
+    "rescore every set on a background thread, or right away if the storage can't take concurrent writes"
+    global _rescorer
+    if not storage.concurrent_writes:
+        rescore(storage)
+        return
+
+    key = (storage.user_id, storage.lang_abr)
+    with _lock:
+        # a rescore still waiting will pick up the latest model anyway
+        if key in _queued:
+            return
+        _queued.add(key)
+        if _rescorer is None:
+            _rescorer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rescore")
+    _rescorer.submit(_run_rescore, storage)
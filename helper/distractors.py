@@ -0,0 +1,152 @@
+import editdistance
+import hashlib
+import numpy as np
+import random
+import re
+import threading
+from collections import OrderedDict, defaultdict
+
+from helper.manifest import load_manifest, set_entry
+
+# most words compared against a blank, whatever the size of the set
+MAX_CANDIDATES = 2000
+# candidates are drawn from words at most this many letters longer or shorter
+MAX_LENGTH_DIFFERENCE = 2
+# how many distractor indices to keep in memory per process
+MAX_CACHED_INDICES = 16
+
+_indices = OrderedDict()  # (user_id, lang_abr, set_name, field) -> (fingerprint, index)
+_lock = threading.Lock()
+
+
+def vocabulary(texts):
+    "unique lowercased words of a list of sentences, without punctuation"
+    return sorted(set(re.sub("[.?¿¡!,]", "", " ".join(texts).lower()).split()))
+
+
+def _bigrams(word):
+    "character bigrams of a word, padded so one letter words have some too"
+    word = f"^{word.lower()}$"
+    return {word[i : i + 2] for i in range(len(word) - 1)}
+
+
+class DistractorIndex:
+    "vocabulary bucketed by word length and character bigram, for bounded nearest word lookups"
+
+    def __init__(self, words):
+        self.words = list(words)
+        self.lengths = np.array([len(x) for x in self.words], dtype=np.int32)
+        postings = defaultdict(list)
+        for i, word in enumerate(self.words):
+            for gram in _bigrams(word):
+                postings[gram].append(i)
+        self.postings = {k: np.array(v, dtype=np.int32) for k, v in postings.items()}
+
+    def candidates(self, target_word, max_candidates, min_candidates, rng=random):
+        "ids of up to max_candidates words of similar length sharing a bigram with the target"
+        near_length = np.abs(self.lengths - len(target_word)) <= MAX_LENGTH_DIFFERENCE
+        grams = [self.postings[x] for x in _bigrams(target_word) if x in self.postings]
+        ids = np.unique(np.concatenate(grams)) if len(grams) > 0 else np.array([], int)
+        ids = ids[near_length[ids]]
+
+        # not enough overlap, fall back to similar length, then to everything
+        if len(ids) < min_candidates:
+            ids = np.flatnonzero(near_length)
+        if len(ids) < min_candidates:
+            ids = np.arange(len(self.words))
+
+        if len(ids) > max_candidates:
+            ids = ids[rng.sample(range(len(ids)), max_candidates)]
+        return ids
+
+
+def find_closest_words(
+    index, target_word, top_n, max_candidates=MAX_CANDIDATES, rng=random
+):
+    "given a vocabulary index, select top x closest to the target word"
+
+    distances = []
+    for i in index.candidates(target_word, max_candidates, top_n + 1, rng):
+        word = index.words[i]
+        if word != target_word:
+            dist = editdistance.eval(target_word, word)
+            distances.append((word, dist))
+    distances.sort(key=lambda x: x[1])
+    return [x[0] for x in distances[:top_n]]
+
+
+def _meta_name(set_name, field):
+    "sidecar name of a set's index, set names can hold any character"
+    digest = hashlib.md5(f"{set_name}|{field}".encode("utf-8")).hexdigest()[:16]
+    return f"distractors.{digest}"
+
+
+def _fingerprint(storage, set_name):
+    "changes whenever rows are added to or removed from a set"
+    entry = set_entry(load_manifest(storage), set_name)
+    if entry is None:
+        return [0, None, None]
+    return [entry["n_sentences"], entry["min_sentence_id"], entry["max_sentence_id"]]
+
+
+def build_distractor_index(
+    storage, set_name, field="translation", texts=None, words=None
+):
+    "build and save the vocabulary index of one column of a set, from its texts or their vocabulary"
+    # indices of a shared set are saved with it, once for every user
+    storage = storage.set_storage(set_name)
+    if words is None:
+        if texts is None:
+            texts = storage.read(sets=[set_name], columns=[field])[field].dropna()
+        words = vocabulary([str(x) for x in texts])
+    fingerprint = _fingerprint(storage, set_name)
+    storage.save_meta(
+        _meta_name(set_name, field), {"fingerprint": fingerprint, "words": words}
+    )
+    return _remember(
+        (storage.user_id, storage.lang_abr, set_name, field),
+        fingerprint,
+        DistractorIndex(words),
+    )
+
+
+def _remember(key, fingerprint, index):
+    "keep an index in memory, dropping the least recently used"
+    with _lock:
+        _indices[key] = (fingerprint, index)
+        _indices.move_to_end(key)
+        while len(_indices) > MAX_CACHED_INDICES:
+            _indices.popitem(last=False)
+    return index
+
+
+def load_distractor_index(storage, set_name, field="translation"):
+    "vocabulary index of one column of a set, built on first use if missing or stale"
+    storage = storage.set_storage(set_name)
+    key = (storage.user_id, storage.lang_abr, set_name, field)
+    fingerprint = _fingerprint(storage, set_name)
+
+    with _lock:
+        if key in _indices and _indices[key][0] == fingerprint:
+            _indices.move_to_end(key)
+            return _indices[key][1]
+
+    saved = storage.load_meta(_meta_name(set_name, field))
+    if saved is not None and saved["fingerprint"] == fingerprint:
+        return _remember(key, fingerprint, DistractorIndex(saved["words"]))
+    return build_distractor_index(storage, set_name, field)
+
+
+def drop_distractor_index(storage, set_name, fields=None):
+    "delete the saved indices of a removed set, or only those of some of its fields"
+    storage = storage.set_storage(set_name)
+    fields = ["translation", "english", "transliteration"] if fields is None else fields
+    for field in fields:
+        storage.delete_meta(_meta_name(set_name, field))
+    with _lock:
+        for key in [
+            x
+            for x in _indices
+            if x[:3] == (storage.user_id, storage.lang_abr, set_name) and x[3] in fields
+        ]:
+            del _indices[key]
@@ -0,0 +1,802 @@
+import csv
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import pandas as pd
+import os
+import threading
+import time
+import zipfile
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from helper.cache import invalidate_corpus
+from helper.difficulty import (
+    count_documents,
+    load_idf_model,
+    model_weights,
+    save_idf_model,
+    score_texts,
+)
+from helper.distractors import (
+    build_distractor_index,
+    drop_distractor_index,
+    vocabulary,
+)
+from helper.manifest import build_manifest, refresh_manifest
+from helper.models import get_model
+
+logger = logging.getLogger(__name__)
+
+# sentences processed and written to the database at a time
+INGEST_CHUNK_ROWS = int(os.environ.get("OPEN_CLOZE_INGEST_CHUNK_ROWS", 20000))
+# texts sent through stanza at once when segmenting
+SEGMENT_BATCH_SIZE = 1000
+# processes segmenting and transliterating new sentences, 1 keeps it all in this process
+INGEST_WORKERS = int(os.environ.get("OPEN_CLOZE_INGEST_WORKERS", 1))
+# "lazy" leaves transliterations of a downloaded corpus to rounds and a background backfill, "eager" does them at setup
+TRANSLITERATION_MODE = os.environ.get("OPEN_CLOZE_TRANSLITERATION", "lazy")
+# sentences transliterated at a time by the backfill, with a pause in between
+BACKFILL_CHUNK_ROWS = 1000
+BACKFILL_PAUSE_SECONDS = 0.5
+
+
+class IngestTimer:
+    "seconds spent and sentences handled per ingest stage, for a throughput report"
+
+    def __init__(self):
+        self.start = time.time()
+        self.seconds = defaultdict(float)
+        self.rows = defaultdict(int)
+        self.counts = Counter()  # other tallies, e.g. transliteration memo hits
+
+    @contextmanager
+    def stage(self, name, n_rows):
+        start = time.time()
+        yield
+        self.seconds[name] += time.time() - start
+        self.rows[name] += n_rows
+
+    def totals(self):
+        "{stage: (seconds, rows)} and the tallies, small enough to send back from a worker process"
+        stages = {x: (self.seconds[x], self.rows[x]) for x in self.seconds}
+        return {"stages": stages, "counts": dict(self.counts)}
+
+    def merge(self, totals):
+        for name, (seconds, rows) in totals["stages"].items():
+            self.seconds[name] += seconds
+            self.rows[name] += rows
+        self.counts.update(totals["counts"])
+
+    def report(self):
+        "one line per stage, seconds are summed over workers"
+        lines = [
+            f"{name}: {self.rows[name]} sentences in {seconds:.1f}s ({self.rows[name] / max(seconds, 1e-9):.0f} sentences/s)"
+            for name, seconds in self.seconds.items()
+        ]
+        lines.append(f"total: {time.time() - self.start:.1f}s")
+        return "\n".join(lines)
+
+
+def download_url(url, save_path, chunk_size=1024**2, progress=None, resume=False):
+    "download a file to disk without holding it in memory, calling progress(bytes so far, total bytes or None) after each chunk. With resume, a partial file is continued"
+    import requests
+
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36"
+    }
+    n_bytes = os.path.getsize(save_path) if resume and os.path.exists(save_path) else 0
+    if n_bytes > 0:
+        headers["Range"] = f"bytes={n_bytes}-"
+
+    r = requests.get(url, stream=True, headers=headers)
+    if n_bytes > 0 and r.status_code == 416:
+        return  # nothing left to download
+    r.raise_for_status()
+    # servers ignoring the range send the whole file again
+    if r.status_code != 206:
+        n_bytes = 0
+    total = r.headers.get("Content-Length")
+    total = int(total) + n_bytes if total is not None else None
+    with open(save_path, "ab" if n_bytes > 0 else "wb") as fd:
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            fd.write(chunk)
+            n_bytes += len(chunk)
+            if progress is not None:
+                progress(n_bytes, total)
+
+
+def file_hash(path):
+    "sha256 of a file, read a block at a time"
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024**2), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def count_lines(zip_path, lang_abr):
+    "number of sentence pairs in a manythings.org archive, roughly, to report progress against"
+    n_lines = 0
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        with zip_ref.open(f"{lang_abr}.txt") as file:
+            for block in iter(lambda: file.read(1024**2), b""):
+                n_lines += block.count(b"\n")
+    return n_lines
+
+
+def read_pairs(zip_path, lang_abr, chunk_rows=INGEST_CHUNK_ROWS):
+    "english/translation pairs of a manythings.org archive, read straight from the zip in chunks"
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        with zip_ref.open(f"{lang_abr}.txt") as file:
+            for chunk in pd.read_csv(
+                file,
+                sep="\t",
+                header=None,
+                usecols=[0, 1],
+                names=["english", "translation"],
+                quoting=csv.QUOTE_NONE,
+                dtype=str,
+                keep_default_na=False,
+                chunksize=chunk_rows,
+            ):
+                yield chunk.loc[lambda x: (x.english != "") & (x.translation != ""), :]
+
+
+# segment chinese and japanese
+def segment_batch(nlp, sentences, batch_size=SEGMENT_BATCH_SIZE):
+    "tokens of each text, a whole batch going through stanza in one bulk call"
+    from stanza import Document
+
+    tokens = []
+    for i in range(0, len(sentences), batch_size):
+        docs = nlp.bulk_process(
+            [Document([], text=x) for x in sentences[i : i + batch_size]]
+        )
+        tokens += [
+            [word.text for sentence in doc.sentences for word in sentence.words]
+            for doc in docs
+        ]
+    return tokens
+
+
+# korean transliteration
+# Mapping tables for Revised Romanization
+KO_INITIALS = [
+    "g",
+    "kk",
+    "n",
+    "d",
+    "tt",
+    "r",
+    "m",
+    "b",
+    "pp",
+    "s",
+    "ss",
+    "",
+    "j",
+    "jj",
+    "ch",
+    "k",
+    "t",
+    "p",
+    "h",
+]
+
+KO_MEDIALS = [
+    "a",
+    "ae",
+    "ya",
+    "yae",
+    "eo",
+    "e",
+    "yeo",
+    "ye",
+    "o",
+    "wa",
+    "wae",
+    "oe",
+    "yo",
+    "u",
+    "wo",
+    "we",
+    "wi",
+    "yu",
+    "eu",
+    "ui",
+    "i",
+]
+
+KO_FINALS = [
+    "",
+    "k",
+    "k",
+    "ks",
+    "n",
+    "nj",
+    "nh",
+    "t",
+    "l",
+    "lk",
+    "lm",
+    "lb",
+    "ls",
+    "lt",
+    "lp",
+    "lh",
+    "m",
+    "p",
+    "ps",
+    "t",
+    "t",
+    "ng",
+    "t",
+    "t",
+    "k",
+    "t",
+    "p",
+    "h",
+]
+
+# romanization of every Hangul syllable (U+AC00 to U+D7A3), for str.translate
+KO_SYLLABLES = {
+    0xAC00 + i: KO_INITIALS[i // 588] + KO_MEDIALS[(i % 588) // 28] + KO_FINALS[i % 28]
+    for i in range(11172)
+}
+
+
+def ko_transliterate(text):
+    return text.translate(KO_SYLLABLES)
+
+
+def ko_transliterate_batch(texts):
+    "romanize a whole column"
+    return [str(x).translate(KO_SYLLABLES) for x in texts]
+
+
+# transliterate, each library is imported the first time its language needs it
+def do_transliterate(lang, sentence, engine=None):
+    transliteration = ""
+    if lang == "Mandarin":
+        import pinyin
+
+        transliteration = pinyin.get(sentence, format="numerical")
+    elif lang == "Russian":
+        from transliterate import translit
+
+        transliteration = translit(sentence, "ru", reversed=True)
+    elif lang == "Greek":
+        from transliterate import translit
+
+        transliteration = translit(sentence, "el", reversed=True)
+    elif lang == "Arabic":
+        from arabic_buckwalter_transliteration.transliteration import (
+            arabic_to_buckwalter,
+        )
+
+        transliteration = arabic_to_buckwalter(sentence)
+    elif lang == "Hindi":
+        try:
+            transliteration = engine.translit_sentence(sentence, lang_code="hi")
+        except:
+            transliteration = ""
+    elif lang == "Bengali":
+        try:
+            transliteration = engine.translit_sentence(sentence, lang_code="bn")
+        except:
+            transliteration = ""
+    elif lang == "Japanese":
+        result = engine.convert(sentence)
+        transliteration = "".join([x["hepburn"] for x in result])
+    elif lang == "Farsi":
+        from aksharamukha import transliterate
+
+        transliteration = transliterate.process(
+            "Arab-Fa", "Latn", sentence, nativize=True
+        )
+    elif lang == "Korean":
+        transliteration = ko_transliterate(sentence)
+
+    return transliteration
+
+
+# transliterations remembered per language, shared by every user
+TRANSLITERATION_DIR = "database/_transliteration"
+# languages worth remembering transliterations for word by word. Korean has its table,
+# and japanese readings depend on the neighbouring words, so its sentences are all distinct
+MEMO_LANGUAGES = [
+    "Mandarin",
+    "Russian",
+    "Greek",
+    "Arabic",
+    "Hindi",
+    "Bengali",
+    "Farsi",
+]
+# words remembered per language, new words past this aren't
+MEMO_MAX_ENTRIES = int(
+    os.environ.get("OPEN_CLOZE_TRANSLITERATION_MEMO_ENTRIES", 200000)
+)
+# languages do_transliterate has an engine for
+TRANSLITERATED_LANGUAGES = MEMO_LANGUAGES + ["Japanese", "Korean"]
+# languages whose engine is a model, which may not be installed
+MODEL_LANGUAGES = ["Japanese", "Hindi", "Bengali"]
+
+
+class TransliterationMemo:
+    "transliteration of each distinct word of a language, up to MEMO_MAX_ENTRIES of them"
+
+    def __init__(self, language, entries=None):
+        self.language = language
+        entries = {} if entries is None else entries
+        # a memo saved with a higher limit is cut down to this one
+        self.entries = dict(itertools.islice(entries.items(), MEMO_MAX_ENTRIES))
+        self.new = {}
+
+    def remember(self, word, transliteration):
+        # the most common words come up first, a full memo still catches most lookups
+        with _memo_lock:
+            if word in self.entries or len(self.entries) < MEMO_MAX_ENTRIES:
+                self.entries[word] = self.new[word] = transliteration
+
+    def transliterate(self, sentences, engine=None, counts=None):
+        "transliteration of each sentence, calling the engine only for words not seen before. counts tallies the hits and misses of this call"
+        counts = Counter() if counts is None else counts
+        results = []
+        for sentence in sentences:
+            words = []
+            for token in sentence.split(" "):
+                if token in self.entries:
+                    counts["memo hits"] += 1
+                    words.append(self.entries[token])
+                else:
+                    counts["memo misses"] += 1
+                    transliteration = (
+                        do_transliterate(self.language, token, engine)
+                        if token != ""
+                        else ""
+                    )
+                    # an empty result is a failed lookup, tried again next time
+                    if transliteration != "":
+                        self.remember(token, transliteration)
+                    words.append(transliteration)
+            results.append(" ".join(words))
+        return results
+
+    def take_new(self):
+        "entries learned since the last call, to send back from a worker process"
+        with _memo_lock:
+            new, self.new = self.new, {}
+        return new
+
+    def merge(self, new):
+        for word, transliteration in new.items():
+            self.remember(word, transliteration)
+
+
+def memo_stats(language, counts):
+    "hit rate of an ingest's lookups and size of the memo, for the ingest report"
+    hits, looked_up = counts["memo hits"], counts["memo hits"] + counts["memo misses"]
+    return f"{hits / max(looked_up, 1):.0%} of {looked_up} lookups hit, {len(get_memo(language).entries)} entries"
+
+
+_memos = {}  # language -> TransliterationMemo of this process
+# guards the memos and every change to them, so a save never sees one half done
+_memo_lock = threading.Lock()
+
+
+def memo_path(language):
+    return f"{TRANSLITERATION_DIR}/{language}.json"
+
+
+def get_memo(language):
+    "the process's transliteration memo of a language, loaded from disk on first use"
+    with _memo_lock:
+        if language not in _memos:
+            try:
+                with open(memo_path(language), "r", encoding="utf-8") as file:
+                    entries = json.load(file)
+            except FileNotFoundError:
+                entries = {}
+            _memos[language] = TransliterationMemo(language, entries)
+        return _memos[language]
+
+
+def save_memo(language):
+    "write a language's memo to disk if it learned new words"
+    memo = get_memo(language)
+    with _memo_lock:
+        if len(memo.new) == 0:
+            return
+        os.makedirs(TRANSLITERATION_DIR, exist_ok=True)
+        # written to a temporary file first so readers never see half a file
+        tmp_path = f"{memo_path(language)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(memo.entries, file, ensure_ascii=False)
+        os.replace(tmp_path, memo_path(language))
+        memo.new = {}
+
+
+def transliterate_batch(lang, sentences, engine=None, counts=None):
+    "transliterations of a list of sentences, counts tallies memo hits and misses"
+    if lang == "Korean":
+        return ko_transliterate_batch(sentences)
+    # without its engine a failed lookup looks like an empty transliteration, don't remember it
+    if lang in MEMO_LANGUAGES and not (lang in ["Hindi", "Bengali"] and engine is None):
+        return get_memo(lang).transliterate(sentences, engine, counts)
+    return [do_transliterate(lang, x, engine) for x in sentences]
+
+
+def transliteration_engine(language):
+    "model do_transliterate needs for a language, if any"
+    try:
+        if language == "Japanese":
+            return get_model("kakasi")
+        elif language in ["Hindi", "Bengali"]:
+            return get_model("xlit_indic")
+    except:
+        return None
+    return None
+
+
+def process_chunk(data, language, engine=None, timer=None, transliterate=True):
+    "segment, simplify and transliterate a chunk of sentence pairs, leaving transliterations empty if not transliterate"
+    data = data.copy()
+    timer = IngestTimer() if timer is None else timer
+
+    # add spaces for chinese and japanese
+    with timer.stage("segment", len(data)):
+        if language == "Mandarin":
+            # tokenization
+            nlp = get_model("stanza_zh")
+            data["translation"] = [
+                " ".join(x) for x in segment_batch(nlp, list(data.translation))
+            ]
+
+            # converting to simplified characters, if opencc is installed
+            try:
+                converter = get_model("opencc_t2s")
+            except:
+                converter = None
+            if converter is not None:
+                data["translation"] = [converter.convert(x) for x in data.translation]
+        elif language == "Japanese":
+            nlp = get_model("stanza_ja")
+            data["translation"] = [
+                " ".join(x) for x in segment_batch(nlp, list(data.translation))
+            ]
+
+    if not transliterate:
+        data["transliteration"] = None
+        return data
+    with timer.stage("transliterate", len(data)):
+        data["transliteration"] = transliterate_batch(
+            language, list(data.translation), engine, timer.counts
+        )
+    return data
+
+
+def _process_worker(data, language, count=False, transliterate=True):
+    "process_chunk in a worker process, which loads its own models and memo. Also counts terms if asked"
+    timer = IngestTimer()
+    # the indic engine takes a while to load, skip it if it won't be used
+    engine = transliteration_engine(language) if transliterate else None
+    data = process_chunk(data, language, engine, timer, transliterate)
+    counts, words = None, None
+    if count:
+        with timer.stage("count", len(data)):
+            counts = count_documents(data.translation, Counter())
+            words = vocabulary(data.translation)
+    return data, counts, words, timer.totals(), get_memo(language).take_new()
+
+
+def map_chunks(function, chunks, workers=INGEST_WORKERS):
+    "function applied to each chunk in a pool of processes, results in order, a few chunks in flight at a time"
+    if workers <= 1:
+        for chunk in chunks:
+            yield function(chunk)
+        return
+
+    # spawned rather than forked, the app process has threads of its own
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(function, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+
+def process_chunks(chunks, language, workers=INGEST_WORKERS, timer=None):
+    "process_chunk over chunks of sentence pairs as they arrive, results in order, spread across workers"
+    timer = IngestTimer() if timer is None else timer
+    chunks = iter(chunks)
+    # starting workers and loading their models only pays off for uploads of several chunks
+    head = list(itertools.islice(chunks, 2))
+    chunks = itertools.chain(head, chunks)
+    try:
+        if workers <= 1 or len(head) < 2:
+            engine = transliteration_engine(language)
+            for chunk in chunks:
+                yield process_chunk(chunk, language, engine, timer)
+        else:
+            for result, _, _, totals, memo in map_chunks(
+                partial(_process_worker, language=language), chunks, workers
+            ):
+                timer.merge(totals)
+                get_memo(language).merge(memo)
+                yield result
+    finally:
+        save_memo(language)
+
+
+def new_rows(data, set_name, first_id):
+    "give new sentences their set, ids and empty progress"
+    data = data.copy()
+    if "missing_indices" not in data.columns:
+        data["missing_indices"] = ""
+    data["set"] = set_name
+    data["last_practiced"] = ""
+    data["n_right"] = 0
+    data["n_wrong"] = 0
+    data["mnemonic"] = ""
+    data["sentence_id"] = list(range(first_id, first_id + len(data)))
+    return data
+
+
+def _count_written(storage, n_rows, chunk_rows=INGEST_CHUNK_ROWS):
+    "term counts and vocabulary of the first n_rows sentences already in storage, to resume an ingest from"
+    counts = Counter()
+    words = set()
+    for chunk in storage.iter_chunks(["sentence_id", "translation"], chunk_rows):
+        texts = chunk.loc[lambda x: x.sentence_id <= n_rows, "translation"].fillna("")
+        count_documents(texts, counts)
+        words.update(vocabulary(texts))
+    return counts, words
+
+
+def ingest_archive(
+    storage,
+    zip_path,
+    language,
+    lang_abr,
+    set_name="Tatoeba",
+    chunk_rows=INGEST_CHUNK_ROWS,
+    workers=INGEST_WORKERS,
+    transliterate=None,
+    progress=None,
+    resume=True,
+    source_hash=None,
+):
+    "build a language database from a manythings.org archive, a few chunks in memory at a time. Returns the stage timings"
+    # progress(stage, sentences done) is called after each chunk of the "process" and "score" passes
+    progress = (lambda stage, n_rows: None) if progress is None else progress
+    timer = IngestTimer()
+
+    # lazily, transliterations are left to backfill_transliterations, which needs to write while sessions do
+    if transliterate is None:
+        transliterate = not (
+            TRANSLITERATION_MODE == "lazy"
+            and storage.concurrent_writes
+            and language in TRANSLITERATED_LANGUAGES
+        )
+
+    # the checkpoint is saved after every chunk, an interrupted ingest of the same archive picks up from it
+    # source_hash is the archive's file_hash, if the caller already has it
+    checkpoint = storage.load_meta("ingest") if resume else None
+    settings = {
+        "source": file_hash(zip_path) if source_hash is None else source_hash,
+        "set": set_name,
+        "chunk_rows": chunk_rows,
+        "transliterate": transliterate,
+    }
+    if (
+        checkpoint is None
+        or checkpoint["complete"]
+        or {x: checkpoint.get(x) for x in settings} != settings
+        or not storage.exists()
+    ):
+        checkpoint = dict(settings, stage="process", chunks=0, rows=0, scored=0)
+    else:
+        logger.info(
+            "resuming %s at %s, %d sentences written, %d scored",
+            storage.lang_abr,
+            checkpoint["stage"],
+            checkpoint["rows"],
+            checkpoint["scored"],
+        )
+    # marks the database as partial until the end
+    checkpoint["complete"] = False
+    storage.save_meta("ingest", checkpoint)
+    if not transliterate and language in TRANSLITERATED_LANGUAGES:
+        storage.save_meta("transliteration_backfill", {"pending": True})
+
+    # first pass, process and write sentences, counting terms for the difficulty
+    # counts from here on are this ingest's
+    memo = get_memo(language)
+    words = None
+    if checkpoint["stage"] == "process":
+        n_rows = checkpoint["rows"]
+        if n_rows > 0:
+            # rows written after the last checkpoint are written again
+            storage.truncate(n_rows)
+            with timer.stage("recount", n_rows):
+                counts, words = _count_written(storage, n_rows, chunk_rows)
+        else:
+            counts, words = Counter(), set()
+
+        for chunk, chunk_counts, chunk_words, totals, chunk_memo in map_chunks(
+            partial(
+                _process_worker,
+                language=language,
+                count=True,
+                transliterate=transliterate,
+            ),
+            itertools.islice(
+                read_pairs(zip_path, lang_abr, chunk_rows), checkpoint["chunks"], None
+            ),
+            workers,
+        ):
+            timer.merge(totals)
+            memo.merge(chunk_memo)
+            counts.update(chunk_counts)
+            words.update(chunk_words)
+            with timer.stage("write", len(chunk)):
+                chunk = new_rows(chunk, set_name, n_rows + 1)
+                if n_rows == 0:
+                    storage.write(chunk)
+                else:
+                    storage.append(chunk)
+            n_rows += len(chunk)
+            checkpoint["chunks"] += 1
+            checkpoint["rows"] = n_rows
+            storage.save_meta("ingest", checkpoint)
+            progress("process", n_rows)
+        save_memo(language)
+
+        save_idf_model(storage, set_name, counts, n_rows)
+        checkpoint["stage"] = "score"
+        storage.save_meta("ingest", checkpoint)
+    n_rows = checkpoint["rows"]
+
+    # second pass, score every sentence against the whole corpus
+    if checkpoint["stage"] == "score":
+        weights, mean_value = model_weights(load_idf_model(storage))
+        # a csv is rewritten whole on every update, so its scores are saved in one go at the end
+        scores = []
+        for chunk in storage.iter_chunks(
+            ["sentence_id", "translation"], chunk_rows, after=checkpoint["scored"]
+        ):
+            with timer.stage("score", len(chunk)):
+                chunk["difficulty"] = score_texts(
+                    chunk.translation, weights, mean_value
+                )
+            if storage.concurrent_writes:
+                with timer.stage("save scores", len(chunk)):
+                    storage.update_rows(chunk, columns=["difficulty"])
+                checkpoint["scored"] = int(chunk.sentence_id.max())
+                storage.save_meta("ingest", checkpoint)
+                progress("score", checkpoint["scored"])
+            else:
+                scores.append(chunk.loc[:, ["sentence_id", "difficulty"]])
+                progress("score", int(chunk.sentence_id.max()))
+        if len(scores) > 0:
+            with timer.stage("save scores", n_rows):
+                storage.update_rows(pd.concat(scores), columns=["difficulty"])
+        checkpoint["scored"] = n_rows
+        checkpoint["stage"] = "index"
+        storage.save_meta("ingest", checkpoint)
+
+    progress("index", n_rows)
+    with timer.stage("index", n_rows):
+        invalidate_corpus(storage)
+        build_manifest(storage)
+        # the vocabulary is read back from the database if the counting pass was resumed past
+        build_distractor_index(
+            storage, set_name, words=sorted(words) if words is not None else None
+        )
+    checkpoint["complete"] = True
+    storage.save_meta("ingest", checkpoint)
+    logger.info(
+        "ingested %s, %d sentences\n%s\ntransliteration memo: %s",
+        storage.lang_abr,
+        n_rows,
+        timer.report(),
+        memo_stats(language, timer.counts) if transliterate else "left to the backfill",
+    )
+    return timer
+
+
+def fill_transliterations(
+    storage, language, data, columns=("translation", "transliteration"), write=True
+):
+    "data with the transliterations it is missing filled in, and written back to storage if write. columns names the original and transliteration columns of data"
+    original, transliterated = columns
+    if language not in TRANSLITERATED_LANGUAGES:
+        return data
+    missing = data[transliterated].isna() & data[original].notna()
+    if not missing.any():
+        return data
+    engine = transliteration_engine(language)
+    if language in MODEL_LANGUAGES and engine is None:
+        return data
+
+    data = data.copy()
+    filled = transliterate_batch(
+        language, [str(x) for x in data.loc[missing, original]], engine
+    )
+    data.loc[missing, transliterated] = filled
+    # empty results are stored as missing, they would be tried again forever
+    filled = pd.DataFrame(
+        {"sentence_id": data.loc[missing, "sentence_id"], "transliteration": filled}
+    ).loc[lambda x: x.transliteration != "", :]
+    if write and len(filled) > 0:
+        storage.update_rows(filled, columns=["transliteration"])
+    save_memo(language)
+    return data
+
+
+def backfill_transliterations(storage, language, pause=BACKFILL_PAUSE_SECONDS):
+    "transliterate every sentence still missing one, a chunk at a time with pauses so rounds don't wait on the database"
+    if language in MODEL_LANGUAGES and transliteration_engine(language) is None:
+        # left pending until the engine is installed
+        logger.info("no transliteration engine for %s, not backfilling", language)
+        return
+    max_sentence_id = storage.max_sentence_id() or 0
+    for start in range(1, max_sentence_id + 1, BACKFILL_CHUNK_ROWS):
+        chunk = storage.read(
+            sentence_ids=range(start, start + BACKFILL_CHUNK_ROWS),
+            columns=["sentence_id", "translation", "transliteration"],
+        )
+        fill_transliterations(storage, language, chunk)
+        time.sleep(pause)
+
+    storage.delete_meta("transliteration_backfill")
+    invalidate_corpus(storage)
+    set_names = [x for x in storage.set_names() if isinstance(x, str)]
+    refresh_manifest(storage, set_names)
+    # indices of the transliterations were built from a partly filled column
+    for set_name in set_names:
+        drop_distractor_index(storage, set_name, fields=["transliteration"])
+    logger.info("backfilled transliterations of %s", storage.lang_abr)
+
+
+_backfiller = None
+_backfilling = set()  # (user_id, lang_abr) queued or running
+_backfill_lock = threading.Lock()
+
+
+def _run_backfill(storage, language):
+    try:
+        backfill_transliterations(storage, language)
+    finally:
+        with _backfill_lock:
+            _backfilling.discard((storage.user_id, storage.lang_abr))
+
+
+def backfill_in_background(storage, language):
+    "start the transliteration backfill of a database on a low priority thread, if it still needs one"
+    global _backfiller
+    # transliterations live with the corpus, which users may share
+    storage = storage.shared()
+    if storage.load_meta("transliteration_backfill") is None:
+        return
+
+    key = (storage.user_id, storage.lang_abr)
+    with _backfill_lock:
+        if key in _backfilling:
+            return
+        _backfilling.add(key)
+        if _backfiller is None:
+            _backfiller = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="backfill"
+            )
+    _backfiller.submit(_run_backfill, storage, language)
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from helper.ingest import (
+    backfill_in_background,
+    count_lines,
+    download_url,
+    ingest_archive,
+)
+from helper.storage import get_storage
+
+# where the sentence pairs of a language are downloaded from, by manythings abbreviation
+MANYTHINGS_URL = "https://www.manythings.org/anki/{}-eng.zip"
+# archives are kept here until their language is set up, so an interrupted setup can resume
+DOWNLOAD_DIR = "database/_downloads"
+# languages being set up at once, shared by every session
+SETUP_WORKERS = int(os.environ.get("OPEN_CLOZE_SETUP_WORKERS", 1))
+# share of the progress bar each stage of a setup takes up
+STAGE_SHARES = {
+    "queued": (0.0, 0.0),
+    "download": (0.0, 0.2),
+    "process": (0.2, 0.8),
+    "score": (0.8, 0.95),
+    "index": (0.95, 1.0),
+}
+STAGE_MESSAGES = {
+    "queued": "Waiting for other languages to finish",
+    "download": "Downloading sentences",
+    "process": "Processing sentences",
+    "score": "Scoring difficulty",
+    "index": "Building indices",
+}
+
+
+class LanguageSetup:
+    "a language database being built in the background, and how far along it is"
+
+    def __init__(self, user_id, language, lang_abr):
+        self.user_id = user_id
+        self.language = language
+        self.lang_abr = lang_abr
+        self.stage = "queued"
+        self.fraction = 0.0  # of the current stage
+        self.error = None
+        self.done = False
+        self.start = time.time()
+
+    def update(self, stage, fraction):
+        self.stage = stage
+        self.fraction = min(max(fraction, 0.0), 1.0)
+
+    def progress(self):
+        "fraction of the whole setup done"
+        start, end = STAGE_SHARES[self.stage]
+        return 1.0 if self.done else start + (end - start) * self.fraction
+
+    def message(self):
+        if self.error is not None:
+            return f"Setting up {self.language} failed: {self.error}"
+        if self.done:
+            return f"{self.language} is ready"
+        return f"{STAGE_MESSAGES[self.stage]} for {self.language}, {time.time() - self.start:.0f}s"
+
+
+def download_stanza(lang_abr):
+    "fetch the stanza tokenizer a language needs for segmenting, if any"
+    if lang_abr in ["cmn", "jpn"]:
+        import stanza
+
+        stanza.download("zh" if lang_abr == "cmn" else "ja", processors="tokenize")
+
+
+def fetch_archive(
+    lang_abr, source=None, download_dir=DOWNLOAD_DIR, offline=False, progress=None
+):
+    "path of the archive of a language, downloading it, or the rest of it, if there's no local copy"
+    if source is not None:
+        return source
+    path = f"{download_dir}/{lang_abr}-eng.zip"
+    if os.path.exists(path):
+        return path
+    if offline:
+        raise FileNotFoundError(f"no archive for {lang_abr} and downloads are off")
+
+    os.makedirs(download_dir, exist_ok=True)
+    # renamed once complete, so an interrupted download isn't mistaken for an archive
+    download_url(
+        MANYTHINGS_URL.format(lang_abr), f"{path}.part", progress=progress, resume=True
+    )
+    os.replace(f"{path}.part", path)
+    return path
+
+
+_jobs = {}  # (owner of the corpus, lang_abr) -> LanguageSetup
+_executor = None
+_lock = threading.Lock()
+
+
+def _run_setup(job):
+    "download and ingest one language, recording progress and failure on the job"
+    storage = get_storage(job.user_id, job.lang_abr)
+    try:
+        os.makedirs(os.path.dirname(storage.path), exist_ok=True)
+
+        # language specific elements
+        download_stanza(job.lang_abr)
+
+        # download the file, it is read straight from the zip in chunks
+        job.update("download", 0.0)
+        zip_path = fetch_archive(
+            job.lang_abr,
+            progress=lambda n_bytes, total: job.update(
+                "download", n_bytes / total if total else 0.0
+            ),
+        )
+
+        # continues from the last checkpoint of an earlier, interrupted setup
+        n_lines = max(count_lines(zip_path, job.lang_abr), 1)
+        ingest_archive(
+            storage,
+            zip_path,
+            job.language,
+            job.lang_abr,
+            progress=lambda stage, n_rows: job.update(stage, n_rows / n_lines),
+        )
+        os.remove(zip_path)
+
+        # transliterations the ingest left out are filled in the background
+        backfill_in_background(storage, job.language)
+        job.done = True
+    except Exception as error:
+        # the partial database and download are kept for trying again, storage.ready() tells them apart
+        job.error = str(error)
+
+
+def _corpus_owner(user_id, lang_abr):
+    "whose copy of a language a user reads, the shared corpus unless they have their own"
+    return get_storage(user_id, lang_abr).shared().user_id
+
+
+def start_setup(user_id, language, lang_abr):
+    "set up a language in the background if that isn't already happening, returns its job"
+    global _executor
+    owner = _corpus_owner(user_id, lang_abr)
+    key = (owner, lang_abr)
+    with _lock:
+        # a failed setup is tried again
+        if key in _jobs and _jobs[key].error is None:
+            return _jobs[key]
+        job = LanguageSetup(owner, language, lang_abr)
+        _jobs[key] = job
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=SETUP_WORKERS, thread_name_prefix="language-setup"
+            )
+    _executor.submit(_run_setup, job)
+    return job
+
+
+def setup_job(user_id, lang_abr):
+    "the background setup of a language, None if there never was one in this process"
+    key = (_corpus_owner(user_id, lang_abr), lang_abr)
+    with _lock:
+        return _jobs.get(key)
+
+
+def language_ready(user_id, lang_abr):
+    "whether a language database is complete and isn't being written by a setup"
+    job = setup_job(user_id, lang_abr)
+    if job is not None and not job.done:
+        return False
+    return get_storage(user_id, lang_abr).ready()
@@ -1,7 +1,7 @@
-import google.generativeai as genai
-
-
 def get_gemini(query, api_key):
+    # slow to import, only needed once someone asks for an explanation
+    import google.generativeai as genai
+
     genai.configure(api_key=api_key)
     model = genai.GenerativeModel("gemini-1.5-pro")
 
@@ -0,0 +1,84 @@
+import pandas as pd
+
+# columns needed to summarize a set
+MANIFEST_COLUMNS = ["sentence_id", "set", "transliteration", "difficulty"]
+
+
+def _float(value):
+    "json friendly float"
+    return None if pd.isna(value) else round(float(value), 4)
+
+
+def summarize_sets(data):
+    "manifest entry for every set in a frame of sentences"
+    entries = []
+    for set_name, rows in data.groupby("set", sort=False):
+        difficulty = rows.difficulty.dropna()
+        entries.append(
+            {
+                "set": set_name,
+                "n_sentences": len(rows),
+                "min_sentence_id": int(rows.sentence_id.min()),
+                "max_sentence_id": int(rows.sentence_id.max()),
+                # ids of a contiguous set can be found from their position alone
+                "contiguous": bool(
+                    rows.sentence_id.max() - rows.sentence_id.min() + 1 == len(rows)
+                    and rows.sentence_id.is_monotonic_increasing
+                ),
+                "has_transliteration": bool(rows.transliteration.notna().any()),
+                "difficulty": {
+                    "min": _float(difficulty.min()),
+                    "p25": _float(difficulty.quantile(0.25)),
+                    "median": _float(difficulty.median()),
+                    "p75": _float(difficulty.quantile(0.75)),
+                    "max": _float(difficulty.max()),
+                    "mean": _float(difficulty.mean()),
+                },
+            }
+        )
+    return entries
+
+
+def build_manifest(storage, data=None):
+    "rebuild and save the manifest of a language database from all of its sentences"
+    if data is None:
+        data = storage.read(columns=MANIFEST_COLUMNS)
+    manifest = {"sets": summarize_sets(data)}
+    storage.save_meta("manifest", manifest)
+    return manifest
+
+
+def load_manifest(storage):
+    "manifest of a language database, built on first use for older databases"
+    manifest = storage.load_meta("manifest")
+    if manifest is None:
+        manifest = build_manifest(storage)
+    return manifest
+
+
+def refresh_manifest(storage, sets):
+    "re-summarize the given sets after rows were added to them"
+    manifest = load_manifest(storage)
+    entries = summarize_sets(storage.read(sets=sets, columns=MANIFEST_COLUMNS))
+    kept = [x for x in manifest["sets"] if x["set"] not in sets]
+    manifest["sets"] = sorted(kept + entries, key=lambda x: x["min_sentence_id"])
+    storage.save_meta("manifest", manifest)
+    return manifest
+
+
+def drop_from_manifest(storage, set_name):
+    "remove a deleted set, along with any rows without a set"
+    manifest = load_manifest(storage)
+    manifest["sets"] = [
+        x
+        for x in manifest["sets"]
+        if x["set"] != set_name and x["set"] != "" and not pd.isna(x["set"])
+    ]
+    storage.save_meta("manifest", manifest)
+    return manifest
+
+
+def set_entry(manifest, set_name):
+    "manifest entry of one set, None for a set without an entry, e.g. rows saved without a set name"
+    entries = [x for x in manifest["sets"] if x["set"] == set_name]
+    return entries[0] if len(entries) > 0 else None
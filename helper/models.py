@@ -0,0 +1,158 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# upper bound on the memory held by loaded models, shared by every session
+MODEL_CACHE_BYTES = int(os.environ.get("OPEN_CLOZE_MODEL_CACHE_MB", 4096)) * 1024**2
+# models unused for this long are unloaded by evict_idle()
+MODEL_IDLE_SECONDS = int(os.environ.get("OPEN_CLOZE_MODEL_IDLE_MINUTES", 60)) * 60
+
+
+def _stanza(lang):
+    import stanza
+
+    return stanza.Pipeline(lang, processors="tokenize", download_method=None)
+
+
+def _xlit():
+    from ai4bharat.transliteration import XlitEngine
+
+    return XlitEngine(src_script_type="indic", beam_width=10, rescore=False)
+
+
+def _kakasi():
+    import pykakasi
+
+    return pykakasi.kakasi()
+
+
+def _opencc():
+    import opencc
+
+    return opencc.OpenCC("t2s.json")
+
+
+def _persian_tts():
+    from TTS.utils.synthesizer import Synthesizer
+
+    config = "database/config.json"  # from https://huggingface.co/Kamtera/persian-tts-male1-vits/resolve/main/config.json?download=true
+    model = "database/checkpoint_88000.pth"  # from https://huggingface.co/Kamtera/persian-tts-male1-vits/resolve/main/checkpoint_88000.pth?download=true
+    return Synthesizer(model, config)
+
+
+# name -> function building the model
+LOADERS = {
+    "stanza_zh": lambda: _stanza("zh"),
+    "stanza_ja": lambda: _stanza("ja"),
+    "xlit_indic": _xlit,
+    "kakasi": _kakasi,
+    "opencc_t2s": _opencc,
+    "persian_tts": _persian_tts,
+}
+
+# name -> {"model", "load_seconds", "n_bytes", "last_used", "n_uses"}
+_models = OrderedDict()
+_load_locks = {name: threading.Lock() for name in LOADERS}
+_lock = threading.Lock()
+
+
+def _rss():
+    "resident memory of the process in bytes, None where /proc isn't available"
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except:
+        return None
+
+
+def _touch(name):
+    "mark a model as just used and return it"
+    entry = _models[name]
+    entry["last_used"] = time.time()
+    entry["n_uses"] += 1
+    _models.move_to_end(name)
+    return entry["model"]
+
+
+def _evict(keep):
+    "unload least recently used models until under the memory cap, never the one just loaded"
+    total = sum(x["n_bytes"] for x in _models.values())
+    for name in list(_models):
+        if total <= MODEL_CACHE_BYTES:
+            break
+        if name != keep:
+            total -= _models.pop(name)["n_bytes"]
+
+
+def get_model(name):
+    "a model shared by all sessions, loaded on first use"
+    evict_idle()
+    with _lock:
+        if name in _models:
+            return _touch(name)
+
+    # one load per model at a time, others asking for it wait and reuse it
+    with _load_locks[name]:
+        with _lock:
+            if name in _models:
+                return _touch(name)
+
+        rss = _rss()
+        start = time.time()
+        model = LOADERS[name]()
+        load_seconds = time.time() - start
+        # memory growth of the whole process while loading, an estimate
+        n_bytes = 0 if rss is None else max(_rss() - rss, 0)
+        logger.info(
+            "loaded model %s in %.1fs, %.0f MB", name, load_seconds, n_bytes / 1024**2
+        )
+
+        with _lock:
+            _models[name] = {
+                "model": model,
+                "load_seconds": load_seconds,
+                "n_bytes": n_bytes,
+                "last_used": time.time(),
+                "n_uses": 0,
+            }
+            _evict(keep=name)
+            return _touch(name)
+
+
+def unload(name):
+    "drop a model, it is loaded again the next time it is asked for"
+    with _lock:
+        _models.pop(name, None)
+
+
+def evict_idle(max_idle_seconds=MODEL_IDLE_SECONDS):
+    "drop models nobody has used for a while, returns their names"
+    now = time.time()
+    with _lock:
+        idle = [
+            name
+            for name, entry in _models.items()
+            if now - entry["last_used"] > max_idle_seconds
+        ]
+        for name in idle:
+            del _models[name]
+    return idle
+
+
+def model_info():
+    "load time, memory and use of every loaded model"
+    with _lock:
+        return [
+            {
+                "model": name,
+                "load_seconds": round(entry["load_seconds"], 2),
+                "memory_mb": round(entry["n_bytes"] / 1024**2, 1),
+                "n_uses": entry["n_uses"],
+                "idle_seconds": round(time.time() - entry["last_used"], 0),
+            }
+            for name, entry in _models.items()
+        ]
@@ -0,0 +1,82 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# threads preparing upcoming questions, shared by all sessions
+PREFETCH_WORKERS = int(os.environ.get("OPEN_CLOZE_PREFETCH_WORKERS", 4))
+# questions of a round prepared ahead of the one being answered
+PREFETCH_AHEAD = int(os.environ.get("OPEN_CLOZE_PREFETCH_AHEAD", 8))
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    "the process-wide prefetch thread pool, started on first use"
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch"
+            )
+        return _executor
+
+
+class Prefetcher:
+    "prepares a round's items in the background a few ahead of the current one, the script picks them up from a queue"
+
+    def __init__(self, prepare, items, first=None, ahead=PREFETCH_AHEAD):
+        "prepare the first item in this thread, then submit the next ones in order"
+        self.prepare = prepare
+        self.items = dict(items)
+        self.ahead = ahead
+        self.futures = {}
+        self.queue = queue.Queue()
+
+        keys = list(self.items)
+        if first in self.items:
+            future = Future()
+            future.set_result(prepare(self.items[first]))
+            self._track(first, future)
+            keys = keys[keys.index(first) + 1 :] + keys[: keys.index(first)]
+        self.submit(keys)
+
+    def submit(self, upcoming):
+        "queue the first items of upcoming not submitted yet, so one round never holds the shared pool for long"
+        for key in list(upcoming)[: self.ahead]:
+            if key not in self.futures:
+                self._track(key, get_executor().submit(self.prepare, self.items[key]))
+
+    def _track(self, key, future):
+        self.futures[key] = future
+        future.add_done_callback(lambda future: self.queue.put((key, future)))
+
+    def is_ready(self, key):
+        return key in self.futures and self.futures[key].done()
+
+    def collect(self, upcoming=()):
+        "(key, result) of every item finished since the last call, then tops up the items prepared ahead of upcoming"
+        self.submit(upcoming)
+        ready = []
+        while True:
+            try:
+                key, future = self.queue.get_nowait()
+            except queue.Empty:
+                return ready
+            # failures are raised when the item is asked for with get()
+            if not future.cancelled() and future.exception() is None:
+                ready.append((key, future.result()))
+
+    def get(self, key):
+        "result of one item, waiting for it if it is still being prepared, or preparing it here if it wasn't submitted"
+        if key not in self.futures:
+            future = Future()
+            future.set_result(self.prepare(self.items[key]))
+            self._track(key, future)
+        return self.futures[key].result()
+
+    def cancel(self):
+        "drop items not started yet, e.g. when a round is restarted"
+        for future in self.futures.values():
+            future.cancel()
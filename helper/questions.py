@@ -1,21 +1,25 @@
 import datetime
-import editdistance
-import glob
-from gtts import gTTS
-import os
+from functools import partial
 import pandas as pd
 import random
 import re
 import streamlit as st
 import streamlit.components.v1 as components
+import threading
 import time
 
-try:
-    from TTS.utils.synthesizer import Synthesizer
-except:
-    pass
-
+from helper.audio import cached_audio
+from helper.cache import invalidate_corpus, load_corpus
+from helper.difficulty import load_difficulty_index
+from helper.distractors import find_closest_words, load_distractor_index
+from helper.ingest import backfill_in_background, fill_transliterations
 from helper.llm import get_gemini
+from helper.models import get_model
+from helper.prefetch import Prefetcher
+from helper.storage import get_storage
+
+# one synthesis at a time per model, prefetch threads share it
+_synthesizer_lock = threading.Lock()
 
 
 def ordinal(n):
@@ -33,6 +37,7 @@ def create_cloze_test(
     reverse=False,
     n_missing=1,
     missing_indices=[],
+    rng=random,
 ):  # reverse for right to left language like arabic
     words = sentence.split()
 
@@ -46,7 +51,7 @@ def create_cloze_test(
 
     # select missing words
     if missing_indices == []:
-        blank_indices = random.sample(good_range, n_missing)
+        blank_indices = rng.sample(good_range, n_missing)
     else:  # take as many as possible from passed missing_indices
         # parse the string
         missing_indices = [int(_) for _ in missing_indices.split(",")]
@@ -56,7 +61,7 @@ def create_cloze_test(
         n_random = n_missing - len(blank_indices)
         good_range = [_ for _ in good_range if _ not in blank_indices]
         if n_random > 0:
-            blank_indices += random.sample(good_range, n_random)
+            blank_indices += rng.sample(good_range, n_random)
 
     blank_indices = sorted(blank_indices)
     blank_words = [words[blank_index] for blank_index in blank_indices]
@@ -74,42 +79,157 @@ def create_cloze_test(
     return cloze_sentence, blank_words, blank_indices, n_missing
 
 
-def find_closest_words(corpus, target_word, top_n):
-    "given a corpus, select top x closest to the target word"
-
-    distances = []
-    for word in corpus:
-        if word != target_word:
-            dist = editdistance.eval(target_word, word)
-            distances.append((word, dist))
-    distances.sort(key=lambda x: x[1])
-    return [x[0] for x in distances[:top_n]]
-
-
 def gen_multiple_choice(
-    sentence_list, target_word, n=3, top_n_sample=100, random_corpus_n=500
+    distractor_index, target_word, n=3, top_n_sample=100, rng=random
 ):
     "generate 4 options for multiple choice"
+    sample = find_closest_words(distractor_index, target_word, top_n_sample, rng=rng)
+    return rng.sample(sample, min(n, len(sample)))
 
-    # random sample for corpus
-    max_corpus = min(random_corpus_n, len(sentence_list))
-
-    corpus = set(
-        re.sub(
-            "[.?¿¡!,]",
-            "",
-            " ".join(
-                list(
-                    sentence_list.loc[
-                        random.sample(list(sentence_list.index), max_corpus),
-                        "translation",
-                    ].values
+
+def create_cloze_batch(
+    sentences,
+    missing_indices,
+    transliterations=None,
+    reverse=False,
+    n_missing=1,
+    show_transliteration_answer=False,
+    distractor_index=None,
+    n_choices=3,
+    rng=random,
+):
+    "cloze sentences, blanks, transliteration and distractors of a whole round, as columns"
+    columns = {
+        "cloze_sentence": [],
+        "min_missing": [],
+        "transliteration_sentence": [],
+    }
+    for n in range(n_missing):
+        columns[f"missing_word_{n}"] = []
+        columns[f"word_index_{n}"] = []
+        columns[f"multiple_choice_{n}"] = []
+
+    for i, sentence in enumerate(sentences):
+        cloze_sentence, missing_words, word_indices, min_missing = create_cloze_test(
+            sentence,
+            reverse,
+            n_missing=n_missing,
+            missing_indices=(
+                missing_indices[i]
+                if (missing_indices[i] != "" and not (pd.isna(missing_indices[i])))
+                else []
+            ),
+            rng=rng,
+        )
+        columns["cloze_sentence"].append(cloze_sentence)
+        columns["min_missing"].append(min_missing)
+
+        # transliteration
+        transliteration = ""
+        if transliterations is not None and not pd.isna(transliterations[i]):
+            transliteration = transliterations[i].split()
+            if not (show_transliteration_answer):
+                for word_index in word_indices:
+                    if word_index < len(transliteration):
+                        transliteration[word_index] = "_____"
+            transliteration = " ".join(transliteration)
+        columns["transliteration_sentence"].append(transliteration)
+
+        # blanks and multiple choice options, empty past this sentence's blanks
+        for n in range(n_missing):
+            if n < min_missing:
+                columns[f"missing_word_{n}"].append(missing_words[n])
+                columns[f"word_index_{n}"].append(word_indices[n])
+                columns[f"multiple_choice_{n}"].append(
+                    ",".join(
+                        gen_multiple_choice(
+                            distractor_index,
+                            missing_words[n],
+                            n=n_choices,
+                            top_n_sample=100,
+                            rng=rng,
+                        )
+                    )
+                    if distractor_index is not None
+                    else ""
                 )
-            ).lower(),
-        ).split()
+            else:
+                columns[f"missing_word_{n}"].append(None)
+                columns[f"word_index_{n}"].append(None)
+                columns[f"multiple_choice_{n}"].append("")
+
+    return columns
+
+
+def gen_audio(text, gt_abbr, synthesizer=None):
+    "cached recording of a sentence, made with gTTS or the farsi synthesizer. None if neither works"
+
+    def speak(path):
+        from gtts import gTTS
+
+        gTTS(text=text, lang=gt_abbr, slow=False).save(path)
+
+    path = cached_audio(gt_abbr, "gtts", text, speak)
+
+    # persian
+    if path is None and synthesizer is not None:
+
+        def synthesize(path):
+            with _synthesizer_lock:
+                wavs = synthesizer.tts(text)
+                synthesizer.save_wav(wavs, path)
+
+        path = cached_audio(gt_abbr, "persian-tts", text, synthesize, "wav")
+    return path
+
+
+def prepare_question(row, settings):
+    "cloze, distractors and audio of one question, without touching streamlit so it can run in a thread"
+    columns = create_cloze_batch(
+        [row["translation"]],
+        [row["missing_indices"]],
+        transliterations=(
+            [row["transliteration"]] if settings["show_transliteration"] else None
+        ),
+        reverse=settings["reverse"],
+        n_missing=settings["n_missing"],
+        show_transliteration_answer=settings["show_transliteration_answer"],
+        distractor_index=settings["distractor_index"],
+        n_choices=settings["n_choices"],
     )
-    sample = find_closest_words(corpus, target_word, top_n_sample)
-    return random.sample(sample, n)
+    item = {key: value[0] for key, value in columns.items()}
+
+    # audio files, shared by every user and round
+    item["audio_path"] = None
+    if settings["gen_pronunciation"]:
+        item["audio_path"] = gen_audio(
+            row["translation"], settings["gt_abbr"], settings["synthesizer"]
+        )
+
+    item["prepared"] = 1
+    return item
+
+
+def apply_prepared(sentence_sample, items):
+    "write prepared questions into their rows of the sample"
+    for sentence_id, item in items:
+        row = sentence_sample.index[sentence_sample.sentence_id == sentence_id][0]
+        for key, value in item.items():
+            sentence_sample.at[row, key] = value
+
+
+def ready_first(prefetcher, sentence_ids):
+    "the sentence_ids whose questions are already prepared, or all of them if none are"
+    ready = [x for x in sentence_ids if prefetcher.is_ready(x)]
+    return ready if len(ready) > 0 else sentence_ids
+
+
+def upcoming_ids(remaining_sample, current=None):
+    "the remaining sentence_ids in the order a sequential round goes through them, from the current one"
+    if current not in remaining_sample:
+        return remaining_sample
+    i = remaining_sample.index(current)
+    return remaining_sample[i:] + remaining_sample[:i]
 
 
 def setup_round():
@@ -120,46 +240,54 @@ def setup_round():
     lang_abr = st.session_state["language_key"][st.session_state["selected_language"]][
         0
     ]
+    storage = get_storage(st.session_state["user_id"], lang_abr)
 
     if "sentence_list" not in st.session_state:
-        st.session_state["full_sentence_list"] = (
-            pd.read_csv(f"database/{st.session_state['user_id']}/{lang_abr}.csv")
-            .loc[lambda x: x.set == st.session_state["selected_set"], :]
-            .reset_index(drop=True)
+        # shared across sessions, so columns are flipped on a renamed view, never in place
+        st.session_state["full_sentence_list"] = load_corpus(
+            storage, st.session_state["selected_set"]
         )
 
         # flip transliteration and original if desired
         if st.session_state["guess_transliteration"]:
-            transliteration = st.session_state["full_sentence_list"]["transliteration"]
-            st.session_state["full_sentence_list"]["transliteration"] = (
-                st.session_state["full_sentence_list"]["translation"]
+            st.session_state["full_sentence_list"] = st.session_state[
+                "full_sentence_list"
+            ].rename(
+                columns={
+                    "transliteration": "translation",
+                    "translation": "transliteration",
+                }
             )
-            st.session_state["full_sentence_list"]["translation"] = transliteration
 
         # flip english and original if desired
         if st.session_state["guess_english"]:
-            english = st.session_state["full_sentence_list"]["english"]
-            translation = st.session_state["full_sentence_list"]["translation"]
-            st.session_state["full_sentence_list"]["english"] = translation
-            st.session_state["full_sentence_list"]["translation"] = english
+            st.session_state["full_sentence_list"] = st.session_state[
+                "full_sentence_list"
+            ].rename(columns={"english": "translation", "translation": "english"})
 
         st.session_state["sentence_list"] = st.session_state[
             "full_sentence_list"
         ]  # because will be edited down later for quantiles
 
-    # percentiles
+        # sorted difficulties of the set, rows keep the same positions after flipping
+        st.session_state["difficulty_index"] = load_difficulty_index(
+            storage, st.session_state["selected_set"]
+        )
+
+    # percentiles, a slice of the set in difficulty order
     if st.session_state["randomize"]:
-        lower_bound = st.session_state["sentence_list"].difficulty.quantile(
+        lower_bound = st.session_state["difficulty_index"].quantile(
             st.session_state["percentile"][0] / 100
         )
-        upper_bound = st.session_state["sentence_list"].difficulty.quantile(
+        upper_bound = st.session_state["difficulty_index"].quantile(
             st.session_state["percentile"][1] / 100
         )
         st.session_state["sentence_list"] = (
-            st.session_state["sentence_list"]
-            .loc[
-                lambda x: (x.difficulty >= lower_bound) & (x.difficulty <= upper_bound),
-                :,
+            st.session_state["full_sentence_list"]
+            .iloc[
+                st.session_state["difficulty_index"].positions_between(
+                    lower_bound, upper_bound
+                )
             ]
             .reset_index(drop=True)
         )
@@ -203,142 +331,132 @@ def setup_round():
                 .loc[lambda x: x.sentence_id.isin(st.session_state["sentence_ids"]), :]
                 .reset_index(drop=True)
             )
-            st.session_state["sentence_sample"]["done_round"] = 0
 
-            # create cloze sentences
-            st.session_state["sentence_sample"]["difficulty_percentile"] = ""
-            st.session_state["sentence_sample"]["cloze_sentence"] = ""
-            st.session_state["sentence_sample"]["transliteration_sentence"] = ""
+            # transliterations not backfilled yet are made now, for the sample only
+            if (
+                st.session_state["show_transliteration"]
+                or st.session_state["guess_transliteration"]
+            ):
+                # which columns of the sample hold the original script and its transliteration after flipping
+                columns = {
+                    "translation": "translation",
+                    "transliteration": "transliteration",
+                }
+                if st.session_state["guess_transliteration"]:
+                    columns = {
+                        "translation": "transliteration",
+                        "transliteration": "translation",
+                    }
+                if st.session_state["guess_english"]:
+                    flip = {"english": "translation", "translation": "english"}
+                    columns = {
+                        key: flip.get(value, value) for key, value in columns.items()
+                    }
+                # not saved, a write would make every session reload the corpus, the backfill saves them
+                st.session_state["sentence_sample"] = fill_transliterations(
+                    storage,
+                    st.session_state["selected_language"],
+                    st.session_state["sentence_sample"],
+                    columns=(columns["translation"], columns["transliteration"]),
+                    write=False,
+                )
+            backfill_in_background(storage, st.session_state["selected_language"])
+            st.session_state["sentence_sample"]["done_round"] = 0
+            st.session_state["sentence_sample"]["difficulty_percentile"] = (
+                st.session_state["difficulty_index"].percentiles(
+                    st.session_state["sentence_sample"]["difficulty"]
+                )
+            )
             st.session_state["sentence_sample"]["missing_word"] = ""
             st.session_state["sentence_sample"]["word_index"] = 0
-            st.session_state["sentence_sample"]["min_missing"] = 0
 
-            for n_missing in range(st.session_state["n_missing"]):
-                st.session_state["sentence_sample"][f"multiple_choice_{n_missing}"] = ""
+            # empty question columns, filled in as questions are prepared
+            for key, default in [
+                ("cloze_sentence", ""),
+                ("min_missing", 0),
+                ("transliteration_sentence", ""),
+                ("audio_path", None),
+                ("prepared", 0),
+            ] + [
+                (f"{column}_{n_missing}", default)
+                for n_missing in range(st.session_state["n_missing"])
+                for column, default in [
+                    ("missing_word", None),
+                    ("word_index", None),
+                    ("multiple_choice", ""),
+                ]
+            ]:
+                st.session_state["sentence_sample"][key] = pd.Series(
+                    [default] * len(st.session_state["sentence_sample"]), dtype=object
+                )
+
+            # vocabulary of whichever column is being guessed
+            if st.session_state["guess_english"]:
+                guessed_field = "english"
+            elif st.session_state["guess_transliteration"]:
+                guessed_field = "transliteration"
+            else:
+                guessed_field = "translation"
+            distractor_index = load_distractor_index(
+                storage, st.session_state["selected_set"], guessed_field
+            )
+
             if st.session_state["persistent_lang_name"] in ["Arabic"]:
                 reverse = True
             else:
                 reverse = False
 
-            # initializing farse text to speech model
+            # farsi text to speech model, loaded once per process
+            synthesizer = None
             if (
                 (st.session_state["gen_pronunciation"])
                 and (st.session_state["selected_language"] == "Farsi")
                 and (st.session_state["gen_pronunciation"])
             ):
-                config = "database/config.json"  # from https://huggingface.co/Kamtera/persian-tts-male1-vits/resolve/main/config.json?download=true
-                model = "database/checkpoint_88000.pth"  # from https://huggingface.co/Kamtera/persian-tts-male1-vits/resolve/main/checkpoint_88000.pth?download=true
-
-                if "farsi_synthesizer" not in st.session_state:
-                    st.session_state["farsi_synthesizer"] = Synthesizer(model, config)
-
-            for i in st.session_state["sentence_sample"].index:
-                cloze_sentence, missing_words, word_indices, min_missing = (
-                    create_cloze_test(
-                        st.session_state["sentence_sample"].loc[i, "translation"],
-                        reverse,
-                        n_missing=st.session_state["n_missing"],
-                        missing_indices=(
-                            st.session_state["sentence_sample"].loc[
-                                i, "missing_indices"
-                            ]
-                            if (
-                                st.session_state["sentence_sample"].loc[
-                                    i, "missing_indices"
-                                ]
-                                != ""
-                                and not (
-                                    pd.isna(
-                                        st.session_state["sentence_sample"].loc[
-                                            i, "missing_indices"
-                                        ]
-                                    )
-                                )
-                            )
-                            else []
-                        ),
-                    )
-                )
-                st.session_state["sentence_sample"].loc[
-                    i, "cloze_sentence"
-                ] = cloze_sentence
-                st.session_state["sentence_sample"].loc[i, "min_missing"] = min_missing
-
-                # transliteration
-                if st.session_state["show_transliteration"]:
-                    transliteration = (
-                        st.session_state["sentence_sample"]
-                        .loc[i, "transliteration"]
-                        .split()
-                    )
-                    if not (st.session_state["show_transliteration_answer"]):
-                        for word_index in word_indices:
-                            transliteration[word_index] = "_____"
-                    transliteration = " ".join(transliteration)
-
-                    st.session_state["sentence_sample"].loc[
-                        i, "transliteration_sentence"
-                    ] = transliteration
-
-                for n_missing in range(min_missing):
-                    st.session_state["sentence_sample"].loc[
-                        i, f"missing_word_{n_missing}"
-                    ] = missing_words[n_missing]
-                    st.session_state["sentence_sample"].loc[
-                        i, f"word_index_{n_missing}"
-                    ] = word_indices[n_missing]
-
-                # multiple choice options
-                for n_missing in range(min_missing):
-                    st.session_state["sentence_sample"].loc[
-                        i, f"multiple_choice_{n_missing}"
-                    ] = ",".join(
-                        gen_multiple_choice(
-                            st.session_state["sentence_list"],
-                            missing_words[n_missing],
-                            n=st.session_state["num_choice"] - 1,
-                            top_n_sample=100,
-                            random_corpus_n=500,
-                        )
-                    )
-
-                # difficulty
-                st.session_state["sentence_sample"].loc[i, "difficulty_percentile"] = (
-                    st.session_state["full_sentence_list"].difficulty
-                    < st.session_state["sentence_sample"].loc[i, "difficulty"]
-                ).mean()
+                try:
+                    synthesizer = get_model("persian_tts")
+                except:
+                    synthesizer = None
 
-                # create audio files
-                if st.session_state["gen_pronunciation"]:
-                    try:
-                        myobj = gTTS(
-                            text=st.session_state["sentence_sample"].loc[
-                                i, "translation"
-                            ],
-                            lang=st.session_state["language_key"][
-                                st.session_state["selected_language"]
-                            ][1],
-                            slow=False,
-                        )
-                        myobj.save(
-                            f"database/{st.session_state['user_id']}/{st.session_state['sentence_sample'].loc[i, 'sentence_id']}.mp3"
-                        )
-                    except:
-                        # persian
-                        try:
-                            wavs = st.session_state["farsi_synthesizer"].tts(
-                                st.session_state["sentence_sample"].loc[
-                                    i, "translation"
-                                ]
-                            )
-                            st.session_state["farsi_synthesizer"].save_wav(
-                                wavs,
-                                f"database/{st.session_state['user_id']}/{st.session_state['sentence_sample'].loc[i, 'sentence_id']}.mp3",
-                            )
-                        except:
-                            st.error(
-                                "Audio not supported for this language, restart the round without `Generate pronunciation` checked."
-                            )
+            # first question
+            sample_ids = list(st.session_state["sentence_sample"]["sentence_id"])
+            if st.session_state["randomize"]:
+                st.session_state["rand_sentence_id"] = random.choice(sample_ids)
+            elif st.session_state["sentence_ids"][0] in sample_ids:
+                st.session_state["rand_sentence_id"] = st.session_state["sentence_ids"][
+                    0
+                ]
+            else:
+                st.session_state["rand_sentence_id"] = sample_ids[0]
+
+            # only the first question is prepared here, the rest in the background
+            st.session_state["prefetcher"] = Prefetcher(
+                partial(
+                    prepare_question,
+                    settings={
+                        "show_transliteration": st.session_state[
+                            "show_transliteration"
+                        ],
+                        "show_transliteration_answer": st.session_state[
+                            "show_transliteration_answer"
+                        ],
+                        "reverse": reverse,
+                        "n_missing": st.session_state["n_missing"],
+                        "distractor_index": distractor_index,
+                        "n_choices": st.session_state["num_choice"] - 1,
+                        "gen_pronunciation": st.session_state["gen_pronunciation"],
+                        "gt_abbr": st.session_state["language_key"][
+                            st.session_state["selected_language"]
+                        ][1],
+                        "synthesizer": synthesizer,
+                    },
+                ),
+                [
+                    (row["sentence_id"], row)
+                    for row in st.session_state["sentence_sample"].to_dict("records")
+                ],
+                first=st.session_state["rand_sentence_id"],
+            )
 
     # remaining sample
     if "remaining_sample" not in st.session_state:
@@ -348,12 +466,26 @@ def setup_round():
             .values
         )
 
+    # pick up questions prepared in the background since the last rerun
+    apply_prepared(
+        st.session_state["sentence_sample"],
+        st.session_state["prefetcher"].collect(
+            upcoming_ids(
+                st.session_state["remaining_sample"],
+                st.session_state.get("rand_sentence_id"),
+            )
+        ),
+    )
+
     if len(st.session_state["remaining_sample"]) > 0:
         if "rand_sentence_id" not in st.session_state:
             # randomized next choice
             if st.session_state["randomize"]:
                 st.session_state["rand_sentence_id"] = random.choice(
-                    st.session_state["remaining_sample"]
+                    ready_first(
+                        st.session_state["prefetcher"],
+                        st.session_state["remaining_sample"],
+                    )
                 )
             # next choice in sequence
             else:
@@ -361,6 +493,29 @@ def setup_round():
                     0
                 ]
 
+        # the question may still be being prepared
+        if (
+            st.session_state["sentence_sample"]
+            .loc[
+                lambda x: x.sentence_id == st.session_state["rand_sentence_id"],
+                "prepared",
+            ]
+            .values[0]
+            == 0
+        ):
+            with st.spinner("Preparing question..."):
+                apply_prepared(
+                    st.session_state["sentence_sample"],
+                    [
+                        (
+                            st.session_state["rand_sentence_id"],
+                            st.session_state["prefetcher"].get(
+                                st.session_state["rand_sentence_id"]
+                            ),
+                        )
+                    ],
+                )
+
         st.session_state["english"] = (
             st.session_state["sentence_sample"]
             .loc[
@@ -589,9 +744,20 @@ def setup_round():
 
         # play audio
         if st.session_state["gen_pronunciation"]:
-            st.audio(
-                f"database/{st.session_state['user_id']}/{st.session_state['rand_sentence_id']}.mp3",
+            audio_path = (
+                st.session_state["sentence_sample"]
+                .loc[
+                    lambda x: x.sentence_id == st.session_state["rand_sentence_id"],
+                    "audio_path",
+                ]
+                .values[0]
             )
+            if pd.isna(audio_path):
+                st.error(
+                    "Audio not supported for this language, restart the round without `Generate pronunciation` checked."
+                )
+            else:
+                st.audio(audio_path)
 
         # mnemonic
         with st.expander("Mnemonic"):
@@ -662,7 +828,10 @@ def setup_round():
             # load a new question
             if st.session_state["randomize"]:
                 st.session_state["rand_sentence_id"] = random.choice(
-                    st.session_state["remaining_sample"]
+                    ready_first(
+                        st.session_state["prefetcher"],
+                        st.session_state["remaining_sample"],
+                    )
                 )
             else:
                 try:
@@ -720,23 +889,10 @@ def setup_round():
     # finished the round
     else:
         # showing finish info
-        st.session_state["sentence_list"] = pd.read_csv(
-            f"database/{st.session_state['user_id']}/{lang_abr}.csv"
-        )
-        total = len(
-            st.session_state["sentence_list"].loc[
-                lambda x: x.set == st.session_state["selected_set"], :
-            ]
-        )
+        total = storage.count(sets=[st.session_state["selected_set"]])
         n_done = min(
             total,
-            len(
-                st.session_state["sentence_list"].loc[
-                    lambda x: (x.n_right >= 1)
-                    & (x.set == st.session_state["selected_set"]),
-                    :,
-                ]
-            )
+            storage.count(sets=[st.session_state["selected_set"]], studied=True)
             + len(st.session_state["sentence_sample"]),
         )  # include those you just did
 
@@ -748,67 +904,15 @@ def setup_round():
             st.session_state["sentence_sample"].loc[
                 :, "last_practiced"
             ] = datetime.date.today().strftime("%Y-%m-%d")
-            merged_df = pd.merge(
-                st.session_state["sentence_list"],
+
+            # only the sentences of this round are written back
+            storage.update_rows(
                 st.session_state["sentence_sample"].loc[
                     :,
                     ["mnemonic", "sentence_id", "n_right", "n_wrong", "last_practiced"],
-                ],
-                how="left",
-                on="sentence_id",
-                suffixes=("_A", "_B"),
-            )
-
-            # overwrite values in A with values from B where key is present in B
-            merged_df["mnemonic"] = merged_df.apply(
-                lambda row: (
-                    row["mnemonic_B"]
-                    if not pd.isna(row["mnemonic_B"])
-                    else row["mnemonic_A"]
-                ),
-                axis=1,
-            )
-
-            merged_df["n_right"] = merged_df.apply(
-                lambda row: (
-                    row["n_right_B"]
-                    if not pd.isna(row["n_right_B"])
-                    else row["n_right_A"]
-                ),
-                axis=1,
-            )
-            merged_df["n_wrong"] = merged_df.apply(
-                lambda row: (
-                    row["n_wrong_B"]
-                    if not pd.isna(row["n_wrong_B"])
-                    else row["n_wrong_A"]
-                ),
-                axis=1,
-            )
-            merged_df["last_practiced"] = merged_df.apply(
-                lambda row: (
-                    row["last_practiced_B"]
-                    if not pd.isna(row["last_practiced_B"])
-                    else row["last_practiced_A"]
-                ),
-                axis=1,
-            )
-            merged_df = merged_df.drop(
-                [
-                    "mnemonic_A",
-                    "mnemonic_B",
-                    "n_right_A",
-                    "n_right_B",
-                    "n_wrong_A",
-                    "n_wrong_B",
-                    "last_practiced_A",
-                    "last_practiced_B",
-                ],
-                axis=1,
-            )
-            merged_df.to_csv(
-                f"database/{st.session_state['user_id']}/{lang_abr}.csv", index=False
+                ]
             )
+            invalidate_corpus(storage)
 
             # progress file
             progress = pd.read_csv(
@@ -833,14 +937,6 @@ def setup_round():
                 float_format="%.6f",
             )
 
-            # deleting audio files
-            mp3_files = glob.glob(
-                os.path.join(f"database/{st.session_state['user_id']}/", "*.mp3")
-            )
-            if len(mp3_files) > 0:
-                for file in mp3_files:
-                    os.remove(file)
-
             # success message
             st.info(
                 f"Successfully studied {len(st.session_state['sentence_ids'])} sentences in {round((st.session_state['end_time'] - st.session_state['start_time'])/60, 0):.0f} minute(s). You have studied {(n_done/total * 100):.6f}% of sentences."
@@ -855,6 +951,7 @@ def setup_round():
                 del st.session_state["remaining_sample"]
                 del st.session_state["rand_sentence_id"]
                 del st.session_state["start_time"]
+                del st.session_state["prefetcher"]
             except:
                 pass
 
@@ -0,0 +1,83 @@
+import subprocess
+import sys
+from collections import defaultdict
+
+# modules app.py imports before showing the login screen
+STARTUP_MODULES = [
+    "helper.data",
+    "helper.questions",
+    "helper.stats",
+    "helper.ui",
+    "helper.user_management",
+]
+# libraries imported by the feature needing them, never at startup
+LAZY_MODULES = [
+    "stanza",
+    "ai4bharat",
+    "aksharamukha",
+    "sklearn",
+    "scipy",
+    "pykakasi",
+    "opencc",
+    "mtranslate",
+    "TTS",
+    "google.generativeai",
+    "gtts",
+    "pinyin",
+    "transliterate",
+    "arabic_buckwalter_transliteration",
+]
+
+
+def import_times(modules=STARTUP_MODULES):
+    "(module, depth, self seconds, cumulative seconds) of every import of modules, in a fresh interpreter"
+    # imported first so their cost shows up on their own lines, streamlit is loaded before the script runs anyway
+    code = "import streamlit, pandas\n" + "\n".join(f"import {x}" for x in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        times.append(
+            (name.strip(), depth, int(self_us) / 1e6, int(cumulative_us) / 1e6)
+        )
+    return times
+
+
+def startup_report(modules=STARTUP_MODULES, top_n=15):
+    "import cost of each startup module and of the packages they pull in"
+    times = import_times(modules)
+    cumulative = {name: seconds for name, depth, _, seconds in times if depth == 0}
+    packages = defaultdict(float)
+    for name, _, self_seconds, _ in times:
+        packages[name.split(".")[0]] += self_seconds
+    loaded = {name for name, _, _, _ in times}
+
+    lines = [f"startup imports: {sum(x[2] for x in times):.2f}s"]
+    lines.append("helper modules, including what they import first:")
+    for module in modules:
+        lines.append(f"  {module}: {cumulative.get(module, 0):.3f}s")
+    lines.append(f"slowest {top_n} packages:")
+    for package, seconds in sorted(packages.items(), key=lambda x: -x[1])[:top_n]:
+        lines.append(f"  {package}: {seconds:.3f}s")
+    eager = [x for x in LAZY_MODULES if x in loaded]
+    lines.append(
+        f"lazy modules imported at startup: {', '.join(eager) if len(eager) > 0 else 'none'}"
+    )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # python -m helper.startup, from the repository root
+    print(startup_report())
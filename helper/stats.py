@@ -1,9 +1,13 @@
 import pandas as pd
-import plotly.express as px
 import streamlit as st
 
+from helper.cache import load_corpus
+from helper.storage import get_storage
+
 
 def calc_stats():
+    import plotly.express as px
+
     all_stats = (
         pd.read_csv(
             f"database/{st.session_state['user_id']}/progress.csv", parse_dates=["date"]
@@ -16,10 +20,12 @@ def calc_stats():
         :,
     ].reset_index(drop=True)
 
-    all_sentences = pd.read_csv(
-        f"database/{st.session_state['user_id']}/{st.session_state['language_key'][st.session_state['selected_language']][0]}.csv",
-        parse_dates=["last_practiced"],
-    )
+    all_sentences = load_corpus(
+        get_storage(
+            st.session_state["user_id"],
+            st.session_state["language_key"][st.session_state["selected_language"]][0],
+        )
+    ).assign(last_practiced=lambda x: pd.to_datetime(x.last_practiced))
 
     sentences = all_sentences.loc[
         lambda x: (x.set == st.session_state["selected_set"]), :
@@ -195,7 +201,9 @@ def calc_stats():
         get_time(_) for _ in (overall_progress["seconds"] / 60)
     ]
 
-    all_sentences["been_studied"] = (all_sentences["n_right"] > 0).astype(int)
+    all_sentences = all_sentences.assign(
+        been_studied=lambda x: (x.n_right > 0).astype(int)
+    )
     sum_info = (
         all_sentences.groupby(["set"])[["set", "n_right", "n_wrong", "been_studied"]]
         .sum(numeric_only=True)
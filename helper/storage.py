@@ -0,0 +1,685 @@
+import json
+import numpy as np
+import os
+import pandas as pd
+import sqlite3
+import threading
+from contextlib import closing
+from urllib.request import pathname2url
+
+# columns of a language database, in file order
+COLUMNS = [
+    "sentence_id",
+    "english",
+    "translation",
+    "transliteration",
+    "missing_indices",
+    "difficulty",
+    "set",
+    "last_practiced",
+    "n_right",
+    "n_wrong",
+    "mnemonic",
+]
+TEXT_COLUMNS = [
+    "english",
+    "translation",
+    "transliteration",
+    "missing_indices",
+    "set",
+    "last_practiced",
+    "mnemonic",
+]
+
+# columns that change as a user practices
+PROGRESS_COLUMNS = [
+    "n_right",
+    "n_wrong",
+    "last_practiced",
+    "mnemonic",
+]
+
+# which backend to use for language databases, "sqlite" or "csv"
+STORAGE_BACKEND = os.environ.get("OPEN_CLOZE_STORAGE", "sqlite")
+# owner of the downloaded corpora every sqlite user reads, database/_shared/<abbr>.db
+SHARED_USER = "_shared"
+# rows held in memory at a time when streaming through a database
+READ_CHUNK_ROWS = 20000
+
+
+def user_dir(user_id):
+    "directory holding a user's files"
+    return f"database/{user_id}"
+
+
+def _normalize(data):
+    "make a frame read from storage look like one read with pd.read_csv"
+    for col in [x for x in TEXT_COLUMNS if x in data.columns]:
+        data[col] = (
+            data[col]
+            .astype(object)
+            .where(data[col].notna() & (data[col] != ""), np.nan)
+        )
+    for col in [x for x in ["n_right", "n_wrong"] if x in data.columns]:
+        data[col] = data[col].fillna(0).astype(int)
+    if "difficulty" in data.columns:
+        data["difficulty"] = data["difficulty"].astype(float)
+    return data
+
+
+def _column_list(columns):
+    "quoted, comma separated column names"
+    return ",".join(f'"{x}"' for x in columns)
+
+
+def _to_text(value):
+    "convert a cell to the text stored in sqlite"
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    value = str(value)
+    return value if value != "" else None
+
+
+def _to_records(data, columns):
+    "rows of a frame as tuples of python objects sqlite understands"
+    data = data.reindex(columns=columns).astype(object)
+    data = data.where(data.notna(), None)
+    for col in [x for x in TEXT_COLUMNS if x in columns]:
+        data[col] = [_to_text(x) for x in data[col]]
+    return list(data.itertuples(index=False, name=None))
+
+
+class FileStorage:
+    "a language database living in a single file, database/<user>/<abbr>.<extension>"
+
+    extension = None
+    # whether background jobs may write while a session does
+    concurrent_writes = False
+
+    def __init__(self, user_id, lang_abr):
+        self.user_id = user_id
+        self.lang_abr = lang_abr
+        self.path = f"{user_dir(user_id)}/{lang_abr}.{self.extension}"
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def ready(self):
+        "whether the database exists and isn't partway through an ingest"
+        checkpoint = self.load_meta("ingest")
+        return self.exists() and (checkpoint is None or checkpoint["complete"])
+
+    def shared(self):
+        "storage holding the corpus itself, where downloads and transliterations are written"
+        return self
+
+    def set_storage(self, set_name):
+        "storage holding a set's sentences, and the indices derived from them"
+        return self
+
+    def own_sets(self):
+        "sets whose sentences this storage holds, and can rescore, itself. None for all of them"
+        return None
+
+    def version(self):
+        "changes whenever the file is written to"
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def meta_path(self, name):
+        "small json file kept beside the database, database/<user>/<abbr>.<name>.json"
+        return f"{user_dir(self.user_id)}/{self.lang_abr}.{name}.json"
+
+    def load_meta(self, name, default=None):
+        try:
+            with open(self.meta_path(name), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return default
+
+    def save_meta(self, name, value):
+        # written to a temporary file first so readers never see half a file
+        tmp_path = f"{self.meta_path(name)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(value, file, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path(name))
+
+    def delete_meta(self, name):
+        try:
+            os.remove(self.meta_path(name))
+        except FileNotFoundError:
+            pass
+
+
+class CSVStorage(FileStorage):
+    "language database kept as a single csv, database/<user>/<abbr>.csv"
+
+    extension = "csv"
+
+    def read(
+        self, sets=None, sentence_ids=None, difficulty=None, columns=None, limit=None
+    ):
+        "read sentences, optionally filtered by set, sentence_id and difficulty range"
+        usecols = None
+        if columns is not None:
+            usecols = list(
+                dict.fromkeys(
+                    columns
+                    + (["set"] if sets is not None else [])
+                    + (["sentence_id"] if sentence_ids is not None else [])
+                    + (["difficulty"] if difficulty is not None else [])
+                )
+            )
+        data = pd.read_csv(self.path, usecols=usecols, nrows=limit)
+        if sets is not None:
+            data = data.loc[lambda x: x.set.isin(sets), :]
+        if sentence_ids is not None:
+            data = data.loc[lambda x: x.sentence_id.isin(sentence_ids), :]
+        if difficulty is not None:
+            data = data.loc[
+                lambda x: (x.difficulty >= difficulty[0])
+                & (x.difficulty <= difficulty[1]),
+                :,
+            ]
+        if columns is not None:
+            data = data.loc[:, columns]
+        return data.reset_index(drop=True)
+
+    def set_names(self):
+        return list(pd.read_csv(self.path, usecols=["set"]).loc[:, "set"].unique())
+
+    def max_sentence_id(self):
+        return pd.read_csv(self.path, usecols=["sentence_id"]).sentence_id.max()
+
+    def write(self, data):
+        "replace the whole database"
+        data.to_csv(self.path, index=False)
+
+    def append(self, data):
+        # rows are added to the end of the file without reading it back
+        header = list(pd.read_csv(self.path, nrows=0).columns)
+        data.reindex(columns=header).to_csv(
+            self.path, mode="a", header=False, index=False
+        )
+
+    def iter_chunks(self, columns=None, chunk_rows=READ_CHUNK_ROWS, after=0):
+        "sentences with ids above after, in order, chunk_rows at a time"
+        usecols = (
+            None if columns is None else list(dict.fromkeys(columns + ["sentence_id"]))
+        )
+        for chunk in pd.read_csv(self.path, usecols=usecols, chunksize=chunk_rows):
+            chunk = chunk.loc[lambda x: x.sentence_id > after, :]
+            if columns is not None:
+                chunk = chunk.loc[:, columns]
+            if len(chunk) > 0:
+                yield chunk.reset_index(drop=True)
+
+    def truncate(self, max_sentence_id):
+        "drop the sentences after an id, e.g. those an interrupted ingest wrote past its checkpoint"
+        data = pd.read_csv(self.path)
+        data.loc[lambda x: x.sentence_id <= max_sentence_id, :].to_csv(
+            self.path, index=False
+        )
+
+    def count(self, sets=None, studied=False):
+        "number of sentences, optionally only those answered right at least once"
+        data = pd.read_csv(self.path, usecols=["set", "n_right"])
+        if sets is not None:
+            data = data.loc[lambda x: x.set.isin(sets), :]
+        if studied:
+            data = data.loc[lambda x: x.n_right >= 1, :]
+        return len(data)
+
+    def update_rows(self, data, columns=PROGRESS_COLUMNS):
+        "overwrite columns (progress by default) for the sentence_ids in data, skipping missing values"
+        updates = data.set_index("sentence_id")
+        columns = [x for x in columns if x in updates.columns]
+        # the file is rewritten a chunk at a time, only the updates are held in memory
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        written = False
+        for chunk in pd.read_csv(self.path, chunksize=READ_CHUNK_ROWS):
+            chunk = chunk.set_index("sentence_id")
+            for col in columns:
+                values = updates[col].dropna()
+                values = values.loc[values.index.isin(chunk.index)]
+                # e.g. the difficulty of a freshly ingested csv
+                if col not in chunk.columns:
+                    chunk[col] = np.nan
+                chunk[col] = chunk[col].astype(object)
+                chunk.loc[values.index, col] = values
+            chunk.reset_index().to_csv(
+                tmp_path, mode="a" if written else "w", header=not written, index=False
+            )
+            written = True
+        if written:
+            os.replace(tmp_path, self.path)
+
+    def delete_set(self, set_name):
+        "remove a set, along with any rows without a set"
+        data = pd.read_csv(self.path)
+        data = data.loc[
+            lambda x: (x.set != set_name) & (x.set != "") & (~pd.isna(x.set)),
+            :,
+        ].reset_index(drop=True)
+        data.to_csv(self.path, index=False)
+
+
+class SQLiteStorage(FileStorage):
+    "language database kept in an indexed sqlite file, database/<user>/<abbr>.db"
+
+    extension = "db"
+    concurrent_writes = True
+    # what reads query, a table here, a view joining the shared corpus for an overlay
+    source = "sentences"
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, uri=True)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sentences (
+                sentence_id INTEGER PRIMARY KEY,
+                english TEXT,
+                translation TEXT,
+                transliteration TEXT,
+                missing_indices TEXT,
+                difficulty REAL,
+                "set" TEXT,
+                last_practiced TEXT,
+                n_right INTEGER NOT NULL DEFAULT 0,
+                n_wrong INTEGER NOT NULL DEFAULT 0,
+                mnemonic TEXT
+            )
+            """)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_set ON sentences ("set")')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_set_difficulty ON sentences ("set", difficulty)'
+        )
+        return conn
+
+    def read(
+        self, sets=None, sentence_ids=None, difficulty=None, columns=None, limit=None
+    ):
+        "read sentences, optionally filtered by set, sentence_id and difficulty range"
+        columns = COLUMNS if columns is None else columns
+        where, params = [], []
+        if sets is not None:
+            where.append(f'"set" IN ({",".join("?" * len(sets))})')
+            params += list(sets)
+        if sentence_ids is not None:
+            # ids go through a temp table so any number of them can be passed
+            where.append("sentence_id IN (SELECT sentence_id FROM temp.read_ids)")
+        if difficulty is not None:
+            where.append("difficulty BETWEEN ? AND ?")
+            params += [float(difficulty[0]), float(difficulty[1])]
+
+        query = f"SELECT {_column_list(columns)} FROM {self.source}"
+        if len(where) > 0:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY sentence_id"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+
+        with closing(self._connect()) as conn:
+            if sentence_ids is not None:
+                conn.execute(
+                    "CREATE TEMP TABLE read_ids (sentence_id INTEGER PRIMARY KEY)"
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO temp.read_ids VALUES (?)",
+                    [(int(x),) for x in sentence_ids],
+                )
+            data = pd.read_sql_query(query, conn, params=params)
+        return _normalize(data)
+
+    def set_names(self):
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f'SELECT "set" FROM {self.source} GROUP BY "set" ORDER BY MIN(sentence_id)'
+            ).fetchall()
+        return [x[0] if x[0] is not None else np.nan for x in rows]
+
+    def max_sentence_id(self):
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                f"SELECT MAX(sentence_id) FROM {self.source}"
+            ).fetchone()[0]
+
+    def write(self, data):
+        "replace the whole database"
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM sentences")
+            self._insert(conn, data)
+
+    def append(self, data):
+        with closing(self._connect()) as conn, conn:
+            self._insert(conn, data)
+
+    def iter_chunks(self, columns=None, chunk_rows=READ_CHUNK_ROWS, after=0):
+        "sentences with ids above after, in order, chunk_rows at a time"
+        max_sentence_id = self.max_sentence_id() or 0
+        for start in range(after + 1, max_sentence_id + 1, chunk_rows):
+            chunk = self.read(
+                sentence_ids=range(start, start + chunk_rows), columns=columns
+            )
+            if len(chunk) > 0:
+                yield chunk
+
+    def truncate(self, max_sentence_id):
+        "drop the sentences after an id, e.g. those an interrupted ingest wrote past its checkpoint"
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "DELETE FROM sentences WHERE sentence_id > ?", (int(max_sentence_id),)
+            )
+
+    def _insert(self, conn, data):
+        conn.executemany(
+            f"INSERT INTO sentences ({_column_list(COLUMNS)}) VALUES ({','.join('?' * len(COLUMNS))})",
+            _to_records(data, COLUMNS),
+        )
+
+    def count(self, sets=None, studied=False):
+        "number of sentences, optionally only those answered right at least once"
+        where, params = [], []
+        if sets is not None:
+            where.append(f'"set" IN ({",".join("?" * len(sets))})')
+            params += list(sets)
+        if studied:
+            where.append("n_right >= 1")
+
+        query = f"SELECT COUNT(*) FROM {self.source}"
+        if len(where) > 0:
+            query += " WHERE " + " AND ".join(where)
+        with closing(self._connect()) as conn:
+            return conn.execute(query, params).fetchone()[0]
+
+    def update_rows(self, data, columns=PROGRESS_COLUMNS):
+        "overwrite columns (progress by default) for the sentence_ids in data, skipping missing values"
+        columns = [x for x in columns if x in data.columns]
+        assignments = ",".join(f'"{x}" = COALESCE(?, "{x}")' for x in columns)
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                f"UPDATE sentences SET {assignments} WHERE sentence_id = ?",
+                _to_records(data, columns + ["sentence_id"]),
+            )
+
+    def delete_set(self, set_name):
+        "remove a set, along with any rows without a set"
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """DELETE FROM sentences WHERE "set" = ? OR "set" IS NULL OR "set" = ''""",
+                (set_name,),
+            )
+
+
+class OverlayStorage(SQLiteStorage):
+    "a user's view of the shared corpus of a language, only their progress, own sets and removed sets are kept, database/<user>/<abbr>.overlay.db"
+
+    source = "corpus"
+
+    def __init__(self, user_id, lang_abr):
+        super().__init__(user_id, lang_abr)
+        self.path = f"{user_dir(user_id)}/{lang_abr}.overlay.db"
+        self.base = SQLiteStorage(SHARED_USER, lang_abr)
+
+    def exists(self):
+        return self.base.exists() or os.path.exists(self.path)
+
+    def version(self):
+        "changes whenever the overlay or the shared corpus is written to"
+        return (super().version(), self.base.version())
+
+    def load_meta(self, name, default=None):
+        "the user's own sidecar, or the shared corpus's while they haven't changed it"
+        value = super().load_meta(name)
+        if value is None:
+            value = self.base.load_meta(name, default)
+        return value
+
+    def shared(self):
+        return self.base
+
+    def set_storage(self, set_name):
+        return self.base if set_name in self._base_sets() else self
+
+    def own_sets(self):
+        "the user's uploaded sets, shared ones keep the difficulty of the shared corpus"
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                'SELECT DISTINCT "set" FROM main.sentences WHERE "set" IS NOT NULL'
+            ).fetchall()
+        return [x[0] for x in rows]
+
+    def _base_sets(self):
+        "sets of the shared corpus the user hasn't removed"
+        if not self.base.exists():
+            return []
+        with closing(self._connect()) as conn:
+            hidden = [x[0] for x in conn.execute('SELECT "set" FROM hidden_sets')]
+        return [x for x in self.base.set_names() if x not in hidden]
+
+    def _connect(self):
+        conn = super()._connect()
+        # progress on sentences of the shared corpus, only those practiced have a row
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS progress (
+                sentence_id INTEGER PRIMARY KEY,
+                last_practiced TEXT,
+                n_right INTEGER,
+                n_wrong INTEGER,
+                mnemonic TEXT
+            )
+            """)
+        conn.execute('CREATE TABLE IF NOT EXISTS hidden_sets ("set" TEXT PRIMARY KEY)')
+
+        # the user's own sets, with their progress in place
+        query = f"SELECT {_column_list(COLUMNS)} FROM main.sentences"
+        if self.base.exists():
+            # read only, nothing a user does changes what the others see
+            conn.execute(
+                "ATTACH DATABASE ? AS base",
+                (f"file:{pathname2url(os.path.abspath(self.base.path))}?mode=ro",),
+            )
+            query = f"""
+                SELECT b.sentence_id, b.english, b.translation, b.transliteration,
+                    b.missing_indices, b.difficulty, b."set", p.last_practiced,
+                    COALESCE(p.n_right, 0) AS n_right, COALESCE(p.n_wrong, 0) AS n_wrong,
+                    p.mnemonic
+                FROM base.sentences AS b
+                LEFT JOIN main.progress AS p ON p.sentence_id = b.sentence_id
+                WHERE b."set" IS NULL OR b."set" NOT IN (SELECT "set" FROM main.hidden_sets)
+                UNION ALL {query}
+                """
+        conn.execute(f"CREATE TEMP VIEW corpus AS {query}")
+        return conn
+
+    def max_sentence_id(self):
+        "highest id of the corpus, counting removed shared sets, so the user's own rows never reuse one"
+        with closing(self._connect()) as conn:
+            ids = [self._max_id(conn, "main")]
+            if self.base.exists():
+                ids.append(self._max_id(conn, "base"))
+        ids = [x for x in ids if x is not None]
+        return max(ids) if len(ids) > 0 else None
+
+    def _max_id(self, conn, schema):
+        return conn.execute(
+            f"SELECT MAX(sentence_id) FROM {schema}.sentences"
+        ).fetchone()[0]
+
+    def _own_ids(self, conn, sentence_ids):
+        "which of the sentence_ids are rows of the user's own sets"
+        if len(sentence_ids) == 0:
+            return set()
+        rows = conn.execute(
+            "SELECT sentence_id FROM main.sentences WHERE sentence_id BETWEEN ? AND ?",
+            (int(min(sentence_ids)), int(max(sentence_ids))),
+        )
+        return {x[0] for x in rows}
+
+    def _save_progress(self, conn, data, columns):
+        "upsert progress on shared sentences, skipping missing values"
+        if len(data) == 0 or len(columns) == 0:
+            return
+        assignments = ",".join(
+            f'"{x}" = COALESCE(excluded."{x}", "{x}")' for x in columns
+        )
+        conn.executemany(
+            f"INSERT INTO progress ({_column_list(['sentence_id'] + columns)}) VALUES ({','.join('?' * (len(columns) + 1))}) ON CONFLICT (sentence_id) DO UPDATE SET {assignments}",
+            _to_records(data, ["sentence_id"] + columns),
+        )
+
+    def write(self, data):
+        "replace the user's part of the database from a full copy of it, rows of the shared corpus only keep their progress"
+        with closing(self._connect()) as conn, conn:
+            for table in ["sentences", "progress", "hidden_sets"]:
+                conn.execute(f"DELETE FROM main.{table}")
+            # a full copy numbers the shared corpus as it does, see migrate_to_overlay
+            base_max = (self.base.exists() and self._max_id(conn, "base")) or 0
+            shared = data.sentence_id <= base_max
+            progress = data.loc[shared].reindex(columns=PROGRESS_COLUMNS)
+            practiced = (
+                (progress.n_right.fillna(0) > 0)
+                | (progress.n_wrong.fillna(0) > 0)
+                | progress.last_practiced.fillna("").astype(str).ne("")
+                | progress.mnemonic.fillna("").astype(str).ne("")
+            )
+            self._save_progress(conn, data.loc[shared].loc[practiced], PROGRESS_COLUMNS)
+            self._insert(conn, data.loc[~shared])
+
+    def update_rows(self, data, columns=PROGRESS_COLUMNS):
+        "overwrite columns for the sentence_ids in data, skipping missing values. On the shared corpus, progress goes to the overlay, transliterations to the corpus and anything else, e.g. difficulty, is left as it is"
+        columns = [x for x in columns if x in data.columns]
+        with closing(self._connect()) as conn, conn:
+            shared = ~data.sentence_id.isin(self._own_ids(conn, data.sentence_id))
+            self._save_progress(
+                conn,
+                data.loc[shared],
+                [x for x in columns if x in PROGRESS_COLUMNS],
+            )
+        super().update_rows(data.loc[~shared], columns)
+        if "transliteration" in columns and shared.any():
+            self.base.update_rows(data.loc[shared], ["transliteration"])
+
+    def delete_set(self, set_name):
+        "remove one of the user's sets, or hide one of the shared corpus"
+        base_sets = self._base_sets()
+        super().delete_set(set_name)
+        if set_name in base_sets:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO hidden_sets VALUES (?)", (set_name,)
+                )
+
+
+BACKENDS = {
+    "csv": CSVStorage,
+    "sqlite": SQLiteStorage,
+}
+
+
+def get_storage(user_id, lang_abr, backend=None):
+    "storage for a user's language database"
+    backend = STORAGE_BACKEND if backend is None else backend
+    # users without a full copy of a language of their own read the shared corpus
+    if (
+        backend == "sqlite"
+        and user_id != SHARED_USER
+        and not SQLiteStorage(user_id, lang_abr).exists()
+    ):
+        return OverlayStorage(user_id, lang_abr)
+    return BACKENDS[backend](user_id, lang_abr)
+
+
+def corpus_owner(user_id):
+    "whose directory downloaded corpora of a user go to, the shared one unless every user keeps full copies"
+    return SHARED_USER if STORAGE_BACKEND == "sqlite" else user_id
+
+
+def has_language_data(user_id):
+    "whether a user has any language databases yet"
+    if not os.path.isdir(user_dir(user_id)):
+        return False
+    return any(
+        (x.endswith(".csv") and x not in ["progress.csv"] and not x.startswith("tmp."))
+        or x.endswith(".db")
+        for x in os.listdir(user_dir(user_id))
+    )
+
+
+def migrate_csv(user_id, backend=None):
+    "one-shot move of a user's <abbr>.csv files into the configured backend"
+    backend = STORAGE_BACKEND if backend is None else backend
+    if backend == "csv":
+        return []
+
+    migrated = []
+    for file in sorted(os.listdir(user_dir(user_id))):
+        if (
+            not file.endswith(".csv")
+            or file == "progress.csv"
+            or file.startswith("tmp.")
+        ):
+            continue
+        lang_abr = file[: -len(".csv")]
+        # a full copy, migrate_to_overlay keeps only the progress if there is a shared corpus
+        storage = BACKENDS[backend](user_id, lang_abr)
+        if not storage.exists():
+            storage.write(CSVStorage(user_id, lang_abr).read())
+        # keep the old file around, but out of the way of future migrations
+        os.replace(
+            f"{user_dir(user_id)}/{file}", f"{user_dir(user_id)}/{file}.migrated"
+        )
+        migrated.append(lang_abr)
+
+    return migrated
+
+
+def migrate_to_overlay(user_id):
+    "swap a user's full copies of languages with a shared corpus for overlays of their progress and own sets"
+    if STORAGE_BACKEND != "sqlite":
+        return []
+
+    migrated = []
+    for file in sorted(os.listdir(user_dir(user_id))):
+        if not file.endswith(".db") or file.endswith(".overlay.db"):
+            continue
+        lang_abr = file[: -len(".db")]
+        full = SQLiteStorage(user_id, lang_abr)
+        overlay = OverlayStorage(user_id, lang_abr)
+        if not overlay.base.exists() or os.path.exists(overlay.path):
+            continue
+
+        # a copy of another version of the corpus can't be matched up by sentence_id
+        data = full.read()
+        base = overlay.base.read(columns=["sentence_id", "translation", "set"])
+        matched = data.merge(base, on="sentence_id", suffixes=("", "_base"))
+        if not (
+            matched.translation.fillna("") == matched.translation_base.fillna("")
+        ).all():
+            continue
+
+        overlay.write(data)
+        kept = set(data.set.dropna())
+        for set_name in [x for x in base.set.dropna().unique() if x not in kept]:
+            overlay.delete_set(set_name)
+        os.replace(full.path, f"{full.path}.migrated")
+        migrated.append(lang_abr)
+
+    return migrated
+
+
+if __name__ == "__main__":
+    # migrate every user's csv files, python -m helper.storage
+    if os.path.isdir(user_dir(SHARED_USER)):
+        migrate_csv(SHARED_USER)
+    for user_id in sorted(os.listdir("database")):
+        # directories starting with _ are shared, e.g. the audio cache
+        if os.path.isdir(user_dir(user_id)) and not user_id.startswith("_"):
+            for lang_abr in migrate_csv(user_id):
+                print(f"{user_id}: migrated {lang_abr}.csv")
+            for lang_abr in migrate_to_overlay(user_id):
+                print(f"{user_id}: {lang_abr}.db now reads the shared corpus")
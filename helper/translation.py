@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# sentences translated at once when uploading text
+TRANSLATION_WORKERS = int(os.environ.get("OPEN_CLOZE_TRANSLATION_WORKERS", 8))
+# which entry of BACKENDS translates uploads
+TRANSLATION_BACKEND = os.environ.get("OPEN_CLOZE_TRANSLATION_BACKEND", "google")
+# attempts per sentence, waiting TRANSLATION_BACKOFF_SECONDS, then twice that, ... in between
+TRANSLATION_ATTEMPTS = 3
+TRANSLATION_BACKOFF_SECONDS = 1.0
+# translations remembered per backend and source language, shared by every user
+TRANSLATION_DIR = "database/_translation"
+# seconds the stub backend waits per sentence, to stand in for a network round trip
+STUB_SECONDS = float(os.environ.get("OPEN_CLOZE_TRANSLATION_STUB_SECONDS", 0))
+
+
+def google_translate(text, source_lang):
+    "english translation from google translate"
+    from mtranslate import translate
+
+    return translate(text, "en", source_lang)
+
+
+def stub_translate(text, source_lang):
+    "a stand in for a remote backend, for tests and benchmarks"
+    time.sleep(STUB_SECONDS)
+    return f"[{source_lang}] {text}"
+
+
+# name -> function(text, source language) returning the english
+BACKENDS = {
+    "google": google_translate,
+    "stub": stub_translate,
+}
+
+
+def translate_with_retry(backend, text, source_lang):
+    "english translation of one sentence, trying again with growing pauses. Empty if every attempt fails"
+    for attempt in range(TRANSLATION_ATTEMPTS):
+        try:
+            return BACKENDS[backend](text, source_lang)
+        except:
+            if attempt < TRANSLATION_ATTEMPTS - 1:
+                time.sleep(TRANSLATION_BACKOFF_SECONDS * 2**attempt)
+    return ""
+
+
+_caches = {}  # (backend, source language) -> {sentence: english}
+_cache_lock = threading.Lock()
+
+
+def cache_path(backend, source_lang):
+    return f"{TRANSLATION_DIR}/{backend}.{source_lang}.json"
+
+
+def get_cache(backend, source_lang):
+    "the translations of a backend and source language, loaded from disk on first use"
+    with _cache_lock:
+        key = (backend, source_lang)
+        if key not in _caches:
+            try:
+                with open(
+                    cache_path(backend, source_lang), "r", encoding="utf-8"
+                ) as file:
+                    _caches[key] = json.load(file)
+            except FileNotFoundError:
+                _caches[key] = {}
+        return _caches[key]
+
+
+def save_cache(backend, source_lang, new):
+    "add new translations to the cache and write it to disk"
+    cache = get_cache(backend, source_lang)
+    with _cache_lock:
+        cache.update(new)
+        os.makedirs(TRANSLATION_DIR, exist_ok=True)
+        # written to a temporary file first so readers never see half a file
+        tmp_path = f"{cache_path(backend, source_lang)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(cache, file, ensure_ascii=False)
+        os.replace(tmp_path, cache_path(backend, source_lang))
+
+
+def translate_sentences(
+    sentences,
+    source_lang,
+    backend=TRANSLATION_BACKEND,
+    workers=TRANSLATION_WORKERS,
+    progress=None,
+):
+    "english translation of each sentence, only sending those not translated before, a few at a time. progress(done, total) is called as they come back"
+    cache = get_cache(backend, source_lang)
+    with _cache_lock:
+        missing = list(dict.fromkeys(x for x in sentences if x not in cache))
+
+    new = {}
+    if len(missing) > 0:
+        with ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="translate"
+        ) as executor:
+            for i, (sentence, english) in enumerate(
+                zip(
+                    missing,
+                    executor.map(
+                        lambda x: translate_with_retry(backend, x, source_lang),
+                        missing,
+                    ),
+                )
+            ):
+                new[sentence] = english
+                if progress is not None:
+                    progress(i + 1, len(missing))
+
+        # failures aren't remembered, they are tried again next time
+        translated = {key: value for key, value in new.items() if value != ""}
+        if len(translated) > 0:
+            save_cache(backend, source_lang, translated)
+
+    with _cache_lock:
+        return [new[x] if x in new else cache[x] for x in sentences]
@@ -1,9 +1,13 @@
-import os
 import pandas as pd
 import streamlit as st
 import time
 
+from helper.cache import load_corpus
+from helper.ingest import TRANSLITERATED_LANGUAGES
+from helper.languages import language_ready, setup_job, start_setup
+from helper.manifest import load_manifest, set_entry
 from helper.questions import setup_round
+from helper.storage import get_storage
 
 
 def ui_tab():
@@ -69,6 +73,21 @@ def ui_header():
     st.markdown(f"""## Open Cloze {st.session_state["flag_emoji"]}""")
 
 
+@st.fragment(run_every=2)
+def setup_progress(user_id, lang_abr):
+    "progress of a language being set up, the whole app reruns once it is done"
+    job = setup_job(user_id, lang_abr)
+    if job.done:
+        st.rerun()
+    elif job.error is not None:
+        st.error(job.message())
+        if st.button("Try again"):
+            start_setup(user_id, job.language, lang_abr)
+            st.rerun()
+    else:
+        st.progress(job.progress(), text=job.message())
+
+
 def sidebar():
     st.sidebar.markdown(
         "# Choose your language",
@@ -84,16 +103,33 @@ def sidebar():
 
     # set selector
     if "language_key" in st.session_state:
-        if os.path.exists(
-            f"database/{st.session_state['user_id']}/{st.session_state['language_key'][st.session_state['selected_language']][0]}.csv"
-        ):
-            st.session_state["set_options"] = list(
-                pd.read_csv(
-                    f"database/{st.session_state['user_id']}/{st.session_state['language_key'][st.session_state['selected_language']][0]}.csv"
+        lang_abr = st.session_state["language_key"][
+            st.session_state["selected_language"]
+        ][0]
+        storage = get_storage(st.session_state["user_id"], lang_abr)
+
+        # languages not downloaded yet are set up in the background, nothing to choose until then
+        st.session_state["language_ready"] = language_ready(
+            st.session_state["user_id"], lang_abr
+        )
+        if not (st.session_state["language_ready"]):
+            if setup_job(st.session_state["user_id"], lang_abr) is None:
+                start_setup(
+                    st.session_state["user_id"],
+                    st.session_state["selected_language"],
+                    lang_abr,
                 )
-                .loc[:, "set"]
-                .unique()
-            )
+            with st.sidebar:
+                setup_progress(st.session_state["user_id"], lang_abr)
+            st.session_state["start_round"] = False
+            st.session_state["active"] = 0
+            return
+
+        if storage.exists():
+            st.session_state["set_manifest"] = load_manifest(storage)
+            st.session_state["set_options"] = [
+                x["set"] for x in st.session_state["set_manifest"]["sets"]
+            ]
 
             st.session_state["selected_set"] = st.sidebar.selectbox(
                 "Select set",
@@ -127,39 +163,45 @@ def sidebar():
     else:
         # not random, show sentence numbers
         # info on sentence numbers
-        st.session_state["set_info"] = (
-            pd.read_csv(
-                f"database/{st.session_state['user_id']}/{st.session_state['language_key'][st.session_state['selected_language']][0]}.csv",
-                usecols=["sentence_id", "set"],
-                low_memory=True,
-            )
-            .loc[lambda x: x.set == st.session_state["selected_set"], :]
-            .reset_index(drop=True)
+        st.session_state["set_info"] = set_entry(
+            st.session_state["set_manifest"], st.session_state["selected_set"]
         )
 
         col1, col2 = st.sidebar.columns(2)
         st.session_state["sequential_selection_1"] = col1.number_input(
             "Sentence number start",
             min_value=1,
-            max_value=len(st.session_state["set_info"]),
+            max_value=st.session_state["set_info"]["n_sentences"],
             value=1,
         )
         st.session_state["sequential_selection_2"] = col2.number_input(
             "Sentence number end",
             min_value=1,
-            max_value=len(st.session_state["set_info"]),
-            value=len(st.session_state["set_info"]),
+            max_value=st.session_state["set_info"]["n_sentences"],
+            value=st.session_state["set_info"]["n_sentences"],
         )
 
-        st.session_state["sequential_sentence_ids"] = list(
-            st.session_state["set_info"]
-            .loc[
-                lambda x: (x.index >= st.session_state["sequential_selection_1"] - 1)
-                & (x.index <= st.session_state["sequential_selection_2"] - 1),
-                "sentence_id",
-            ]
-            .values
-        )
+        # ids follow from the position in the set if it has no gaps
+        if st.session_state["set_info"]["contiguous"]:
+            st.session_state["sequential_sentence_ids"] = range(
+                st.session_state["set_info"]["min_sentence_id"]
+                + st.session_state["sequential_selection_1"]
+                - 1,
+                st.session_state["set_info"]["min_sentence_id"]
+                + st.session_state["sequential_selection_2"],
+            )
+        else:
+            st.session_state["sequential_sentence_ids"] = list(
+                load_corpus(storage, st.session_state["selected_set"])
+                .loc[
+                    lambda x: (
+                        x.index >= st.session_state["sequential_selection_1"] - 1
+                    )
+                    & (x.index <= st.session_state["sequential_selection_2"] - 1),
+                    "sentence_id",
+                ]
+                .values
+            )
 
     # guess english?
     st.session_state["guess_english"] = st.sidebar.checkbox(
@@ -195,15 +237,12 @@ def sidebar():
         "Generate pronunciation?", help="Add an option to read the sentence aloud"
     )
 
-    # transliteration stuff
+    # transliteration stuff, languages with an engine may not be transliterated yet
     if (
-        len(
-            pd.read_csv(
-                f"database/{st.session_state['user_id']}/{st.session_state['language_key'][st.session_state['selected_language']][0]}.csv",
-                nrows=2,
-            ).loc[lambda x: ~pd.isna(x.transliteration), :]
-        )
-        > 0
+        st.session_state["selected_language"] in TRANSLITERATED_LANGUAGES
+        or set_entry(
+            st.session_state["set_manifest"], st.session_state["selected_set"]
+        )["has_transliteration"]
     ):
         # show transliteration?
         st.session_state["show_transliteration"] = st.sidebar.checkbox(
@@ -249,6 +288,11 @@ def show_round():
 
     if (st.session_state["start_round"]) or (st.session_state["restart_round"]):
         # end mid-round
+        try:
+            st.session_state["prefetcher"].cancel()
+            del st.session_state["prefetcher"]
+        except:
+            pass
         try:
             del st.session_state["sentence_list"]
             del st.session_state["wrong_counter"]